@@ -0,0 +1,51 @@
+from functools import partial
+
+from bush_assignment import algorithm_b, solve_algorithm_b
+from real_graphs import biconjugate_frank_wolfe, conjugate_frank_wolfe, frank_wolfe, msa, solve_frank_wolfe, solve_msa
+
+# Logit dispersion of the stochastic mode, per unit of travel time; larger
+# values concentrate drivers on the shortest paths.
+SUE_THETA = 0.5
+
+ASSIGNMENT_ALGORITHMS = {
+    "msa": msa,
+    "sue": partial(msa, theta=SUE_THETA),
+    "fw": frank_wolfe,
+    "cfw": conjugate_frank_wolfe,
+    "bfw": biconjugate_frank_wolfe,
+    "algb": algorithm_b,
+}
+
+# The same algorithms on an already compiled network; they return the
+# result arrays instead of an annotated graph copy.
+NETWORK_SOLVERS = {
+    "msa": solve_msa,
+    "sue": partial(solve_msa, theta=SUE_THETA),
+    "fw": partial(solve_frank_wolfe, variant="fw"),
+    "cfw": partial(solve_frank_wolfe, variant="cfw"),
+    "bfw": partial(solve_frank_wolfe, variant="bfw"),
+    "algb": solve_algorithm_b,
+}
+
+# Gap each algorithm converges to by default; the window uses it to scale
+# the progress bar.
+TARGET_GAPS = {
+    "msa": 1e-4,
+    "sue": 1e-4,
+    "fw": 1e-4,
+    "cfw": 1e-4,
+    "bfw": 1e-4,
+    "algb": 1e-10,
+}
+
+# What the reported gap measures: the relative gap of the Beckmann
+# objective, or for the stochastic mode, how far the loaded flows are from
+# reproducing the volumes. The two are not comparable.
+GAP_MEASURES = {
+    "msa": "relative_gap",
+    "sue": "flow_gap",
+    "fw": "relative_gap",
+    "cfw": "relative_gap",
+    "bfw": "relative_gap",
+    "algb": "relative_gap",
+}
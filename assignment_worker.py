@@ -0,0 +1,71 @@
+import math
+import queue
+import threading
+
+from telemetry import Telemetry
+
+
+class AssignmentCancelled(Exception):
+    pass
+
+
+class AssignmentWorker:
+    def __init__(self, algorithm, graph, od_pairs, warm_start=None, target_gap=1e-4):
+        self.algorithm = algorithm
+        self.graph = graph
+        self.od_pairs = od_pairs
+        self.warm_start = warm_start
+        self.target_gap = target_gap
+
+        self.messages = queue.Queue()
+        self.first_gap = None
+        self.telemetry = Telemetry(quiet=True)
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def progress_fraction(self, gap):
+        # A solver may report an infinite gap before anything is loaded;
+        # progress is measured from the first finite one.
+        if self.first_gap is None:
+            if not math.isfinite(gap):
+                return 0.0
+            self.first_gap = gap
+        if gap <= self.target_gap:
+            return 1.0
+        if self.first_gap <= self.target_gap or gap <= 0 or gap >= self.first_gap:
+            return 0.0
+        return math.log(self.first_gap / gap) / math.log(self.first_gap / self.target_gap)
+
+    def _progress(self, iteration, gap):
+        # Raised from inside the solver loop, so cancellation takes effect
+        # at the next iteration boundary.
+        if self._cancelled.is_set():
+            raise AssignmentCancelled()
+        self.messages.put(("progress", iteration, gap))
+
+    def _run(self):
+        try:
+            result = self.algorithm(self.graph, self.od_pairs, warm_start=self.warm_start, progress=self._progress,
+                                    telemetry=self.telemetry)
+            self.messages.put(("done", result))
+        except AssignmentCancelled:
+            self.messages.put(("cancelled",))
+        except Exception as e:
+            self.messages.put(("error", str(e)))
+
+    def poll(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
@@ -0,0 +1,180 @@
+import argparse
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from assignment import ASSIGNMENT_ALGORITHMS, NETWORK_SOLVERS
+from multiclass import DEFAULT_VEHICLE_CLASSES
+from periods import solve_network_periods, solve_periods
+from result_cache import ResultCache
+from result_export import LinkResultWriter, export_history, export_links
+from scenario import BINARY_EXTENSION, read_binary_network, read_scenario
+from telemetry import Telemetry
+
+SUMMARY_FIELDS = ["scenario", "status", "algorithm", "nodes", "edges", "od_pairs", "iterations", "relative_gap",
+                  "total_cost", "total_volume", "average_cost", "max_vc_ratio", "seconds"]
+
+
+def summarize_result(graph):
+    total_cost = 0
+    total_volume = 0
+    max_vc_ratio = 0
+
+    for u, v, data in graph.edges(data=True):
+        volume = data.get("volume", 0)
+        total_cost += volume * data.get("travel_time", 0)
+        total_volume += volume
+        max_vc_ratio = max(max_vc_ratio, volume / data["capacity"])
+
+    return {
+        "total_cost": total_cost,
+        "total_volume": total_volume,
+        "average_cost": total_cost / total_volume if total_volume > 0 else 0,
+        "max_vc_ratio": max_vc_ratio,
+    }
+
+
+def summarize_network(net, result):
+    volume = result["volume"]
+    total_cost = float(volume @ result["travel_time"])
+    total_volume = float(volume.sum())
+    return {
+        "total_cost": total_cost,
+        "total_volume": total_volume,
+        "average_cost": total_cost / total_volume if total_volume > 0 else 0,
+        "max_vc_ratio": float((volume / net.capacity).max(initial=0)),
+    }
+
+
+def _solve_graph(filepath, name, algorithm, telemetry, cache_dir, links_path):
+    graph, od_pairs = read_scenario(filepath)
+    periods = graph.graph.pop("periods", None)
+    summary = {"nodes": graph.number_of_nodes(), "edges": graph.number_of_edges(),
+               "od_pairs": sum(len(matrix) for matrix in periods.values()) if periods else len(od_pairs)}
+
+    if periods:
+        # Scenarios already run in parallel, so their periods are solved
+        # one after another.
+        solver = partial(solve_periods, algorithm=algorithm, workers=1)
+        demand = periods
+    else:
+        solver, demand = ASSIGNMENT_ALGORITHMS[algorithm], od_pairs
+    if cache_dir:
+        solver = ResultCache(cache_dir).wrap(solver, algorithm, periods=bool(periods))
+    result = solver(graph, demand, telemetry=telemetry)
+
+    export_links(links_path, result, name)
+    summary.update(summarize_result(result), status="cached" if result.graph.get("cached") else "ok",
+                   iterations=result.graph.get("iterations"), relative_gap=result.graph.get("relative_gap"))
+    return summary
+
+
+def _solve_network(filepath, name, algorithm, telemetry, links_path):
+    # Binary scenarios are compiled straight from their mapped arrays and
+    # solved without ever building a networkx graph.
+    net, od_pairs, pce, periods = read_binary_network(filepath)
+    vehicle_classes = dict(DEFAULT_VEHICLE_CLASSES, **pce)
+    summary = {"nodes": net.n_nodes, "edges": net.n_edges,
+               "od_pairs": sum(len(matrix) for matrix in periods.values()) if periods else len(od_pairs)}
+
+    if periods:
+        results = solve_network_periods(net, periods, vehicle_classes, algorithm, workers=1, telemetry=telemetry)
+    else:
+        results = {None: NETWORK_SOLVERS[algorithm](net, od_pairs, vehicle_classes, telemetry=telemetry)}
+
+    with LinkResultWriter(links_path) as writer:
+        writer.write_network(net, results, name)
+    # As with graph results, the summary describes the first period.
+    summary.update(summarize_network(net, next(iter(results.values()))), status="ok",
+                   iterations=max(result["iterations"] for result in results.values()),
+                   relative_gap=max(result["relative_gap"] for result in results.values()))
+    return summary
+
+
+def solve_scenario(filepath, algorithm, output_dir, telemetry=False, cache_dir=None, export_format="csv"):
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    summary = {"scenario": name, "algorithm": algorithm}
+    start = time.perf_counter()
+
+    try:
+        sink = os.path.join(output_dir, f"{name}_telemetry.jsonl") if telemetry else None
+        monitor = Telemetry(sink=sink, quiet=True)
+        links_path = os.path.join(output_dir, f"{name}_links.{export_format}")
+        # Cached results are keyed on the graph, so cached runs of binary
+        # scenarios still take the graph route.
+        if filepath.endswith(BINARY_EXTENSION) and not cache_dir:
+            summary.update(_solve_network(filepath, name, algorithm, monitor, links_path))
+        else:
+            summary.update(_solve_graph(filepath, name, algorithm, monitor, cache_dir, links_path))
+        export_history(os.path.join(output_dir, f"{name}_history.{export_format}"), monitor.history, name)
+    except Exception as e:
+        summary["status"] = f"error: {e}"
+
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def collect_scenarios(patterns):
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in ("*.json", f"*{BINARY_EXTENSION}", "*_net.tntp"):
+                files.extend(sorted(glob.glob(os.path.join(pattern, extension))))
+        else:
+            files.extend(sorted(glob.glob(pattern)) or [pattern])
+    return list(dict.fromkeys(files))
+
+
+def run_batch(files, algorithm="bfw", output_dir="batch_results", processes=None, telemetry=False, cache_dir=None,
+              export_format="csv"):
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    summaries = []
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(solve_scenario, filepath, algorithm, output_dir, telemetry, cache_dir, export_format)
+                   for filepath in files]
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            print(f"[{len(summaries)}/{len(files)}] {summary['scenario']}: {summary['status']} "
+                  f"({summary['seconds']:.2f}s)")
+
+    summaries.sort(key=lambda summary: summary["scenario"])
+    with open(os.path.join(output_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    elapsed = time.perf_counter() - start
+    throughput = len(files) / elapsed * 60 if elapsed > 0 else 0
+    print(f"Solved {len(files)} scenarios in {elapsed:.1f}s ({throughput:.1f} scenarios/min)")
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve saved scenario files without opening the editor.")
+    parser.add_argument("scenarios", nargs="+", help="scenario files, directories or glob patterns")
+    parser.add_argument("-a", "--algorithm", default="bfw", choices=list(ASSIGNMENT_ALGORITHMS))
+    parser.add_argument("-o", "--output-dir", default="batch_results")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("-t", "--telemetry", action="store_true",
+                        help="write per-iteration convergence and phase timings to <scenario>_telemetry.jsonl")
+    parser.add_argument("-c", "--cache", default=None, metavar="DIR",
+                        help="reuse results of earlier identical solves stored in DIR")
+    parser.add_argument("-f", "--format", default="csv", choices=["csv", "parquet", "arrow"],
+                        help="file format of the link results and iteration history (parquet and arrow need pyarrow)")
+    args = parser.parse_args()
+
+    files = collect_scenarios(args.scenarios)
+    if not files:
+        parser.error("no scenario files found")
+
+    run_batch(files, args.algorithm, args.output_dir, args.processes, args.telemetry, args.cache, args.format)
+
+
+if __name__ == "__main__":
+    main()
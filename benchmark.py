@@ -0,0 +1,418 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+import networkx as nx
+import numpy as np
+
+from assignment import ASSIGNMENT_ALGORITHMS, GAP_MEASURES
+from od_matrix import ODMatrix
+from real_graphs import bpr_integral
+from scenario import BINARY_EXTENSION, write_scenario
+from telemetry import Telemetry
+
+SUITES = {
+    "small": [
+        ("grid", {"rows": 8, "cols": 8, "zones": 16}),
+        ("corridor", {"length": 30, "ramp_every": 3, "zones": 12}),
+        ("planar", {"n_nodes": 150, "zones": 20, "seed": 1}),
+    ],
+    "medium": [
+        ("grid", {"rows": 20, "cols": 20, "zones": 40}),
+        ("corridor", {"length": 120, "ramp_every": 4, "zones": 30}),
+        ("planar", {"n_nodes": 800, "zones": 50, "seed": 1}),
+    ],
+    "large": [
+        ("grid", {"rows": 40, "cols": 40, "zones": 80}),
+        ("planar", {"n_nodes": 3000, "zones": 100, "seed": 1}),
+    ],
+}
+
+
+# Target of the stochastic mode's flow gap, which falls about as 1/n with
+# MSA steps and is not comparable to the relative gap target.
+FLOW_GAP_TARGET = 1e-3
+
+# Edits each network gets in the warm start check; the iterations a single
+# re-solve takes vary with where its tail happens to end.
+WARM_CHECK_EDITS = 3
+
+
+class TargetReached(Exception):
+    pass
+
+
+def _add_link(graph, u, v, length, speed, capacity):
+    graph.add_edge(u, v, weight=round(length / speed, 4), capacity=capacity)
+    graph.add_edge(v, u, weight=round(length / speed, 4), capacity=capacity)
+
+
+def od_table(positions, zones, demand_scale, rng):
+    # Gravity-style demand between every ordered pair of zone centroids, so
+    # each zone is both an origin and a destination.
+    centroids = rng.sample(sorted(positions), min(zones, len(positions)))
+    mass = {node: rng.uniform(0.5, 1.5) for node in centroids}
+    od_pairs = []
+    for origin in centroids:
+        ox, oy = positions[origin]
+        for destination in centroids:
+            if destination == origin:
+                continue
+            dx, dy = positions[destination][0] - ox, positions[destination][1] - oy
+            demand = demand_scale * mass[origin] * mass[destination] / (1 + math.hypot(dx, dy)) ** 0.5
+            od_pairs.append((origin, destination, round(demand, 3)))
+    return od_pairs
+
+
+def grid_network(rows, cols, zones, spacing=1.0, capacity=50.0, demand_scale=12.0, seed=0):
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    positions = {}
+    for i in range(rows):
+        for j in range(cols):
+            node = i * cols + j
+            positions[node] = (j * spacing, i * spacing)
+            graph.add_node(node)
+            if j > 0:
+                _add_link(graph, node - 1, node, spacing, 0.2, capacity)
+            if i > 0:
+                _add_link(graph, node - cols, node, spacing, 0.2, capacity)
+
+    graph.graph["positions"] = positions
+    return graph, od_table(positions, zones, demand_scale, rng)
+
+
+def corridor_network(length, ramp_every, zones, spacing=1.0, demand_scale=20.0, seed=0):
+    # A fast, high-capacity main line with a slower parallel arterial; the
+    # two are joined by ramps every few nodes.
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    positions = {}
+    for k in range(length):
+        main, arterial = k, length + k
+        positions[main] = (k * spacing, 1.0)
+        positions[arterial] = (k * spacing, 0.0)
+        if k > 0:
+            _add_link(graph, main - 1, main, spacing, 1.0, 200.0)
+            _add_link(graph, arterial - 1, arterial, spacing, 0.5, 80.0)
+        if k % ramp_every == 0:
+            _add_link(graph, main, arterial, 1.0, 0.5, 60.0)
+
+    graph.graph["positions"] = positions
+    return graph, od_table({node: positions[node] for node in range(length, 2 * length)}, zones, demand_scale, rng)
+
+
+def planar_network(n_nodes, zones, arterial_share=0.15, extra_links=0.35, diagonals=0.15, demand_scale=5.0, seed=0):
+    # A jittered grid: a random spanning tree keeps every node reachable, and
+    # extra grid links plus at most one diagonal per cell add loops without
+    # any two links crossing.
+    rng = random.Random(seed)
+    side = max(2, math.ceil(math.sqrt(n_nodes)))
+    nodes = [(i, j) for i in range(side) for j in range(side)][:n_nodes]
+    index = {cell: k for k, cell in enumerate(nodes)}
+    positions = {k: (j + rng.uniform(-0.3, 0.3), i + rng.uniform(-0.3, 0.3)) for k, (i, j) in enumerate(nodes)}
+
+    candidates = set()
+    for (i, j), k in index.items():
+        for cell in ((i + 1, j), (i, j + 1)):
+            if cell in index:
+                candidates.add((k, index[cell]))
+
+    parent = list(range(len(nodes)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    links = set()
+    ordered = sorted(candidates)
+    rng.shuffle(ordered)
+    for u, v in ordered:
+        root_u, root_v = find(u), find(v)
+        if root_u != root_v:
+            parent[root_u] = root_v
+            links.add((u, v))
+        elif rng.random() < extra_links:
+            links.add((u, v))
+
+    for (i, j), k in index.items():
+        if rng.random() < diagonals and (i + 1, j + 1) in index and (i, j + 1) in index and (i + 1, j) in index:
+            if rng.random() < 0.5:
+                links.add((k, index[(i + 1, j + 1)]))
+            else:
+                links.add((index[(i, j + 1)], index[(i + 1, j)]))
+
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(len(nodes)))
+    for u, v in sorted(links):
+        (x1, y1), (x2, y2) = positions[u], positions[v]
+        arterial = rng.random() < arterial_share
+        _add_link(graph, u, v, math.hypot(x2 - x1, y2 - y1), 0.4 if arterial else 0.2, 120.0 if arterial else 40.0)
+
+    graph.graph["positions"] = positions
+    return graph, od_table(positions, zones, demand_scale, rng)
+
+
+GENERATORS = {
+    "grid": grid_network,
+    "corridor": corridor_network,
+    "planar": planar_network,
+}
+
+
+def network_name(kind, params):
+    return kind + "-" + "-".join(f"{key}{value}" for key, value in params.items())
+
+
+def run_case(algorithm, graph, od_pairs, target_gap, max_iter, trace_memory=False):
+    times = []
+    gaps = []
+    reached = []
+    finish = {}
+
+    def record(event):
+        if event["event"] == "finish":
+            finish.update(event)
+
+    def progress(iteration, gap):
+        times.append(time.perf_counter())
+        gaps.append(gap)
+        # The solvers' own stopping rules differ (MSA stops on flow change),
+        # so every run is cut at the same gap from here. A cold start has
+        # nothing loaded on its first iteration, which says nothing about
+        # convergence.
+        if math.isfinite(gap) and gap <= target_gap and (iteration > 1 or gap > 0):
+            reached.append(iteration)
+            raise TargetReached()
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        ASSIGNMENT_ALGORITHMS[algorithm](graph, od_pairs, max_iter, 0.0, progress=progress,
+                                         telemetry=Telemetry(callback=record, quiet=True))
+    except TargetReached:
+        pass
+    end = time.perf_counter()
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    iteration_seconds = np.diff([start] + times).tolist()
+    return {
+        "iterations": len(times),
+        "converged": bool(reached),
+        "relative_gap": gaps[-1] if gaps else None,
+        "seconds": end - start,
+        "seconds_to_target": times[-1] - start if reached else None,
+        "first_iteration_seconds": iteration_seconds[0] if iteration_seconds else None,
+        "mean_iteration_seconds": float(np.mean(iteration_seconds[1:])) if len(iteration_seconds) > 1 else None,
+        "iteration_seconds": iteration_seconds,
+        "phase_seconds": finish.get("phase_seconds", {}),
+        "gaps": gaps,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_suite(cases, algorithms, target_gap=1e-4, max_iter=1000, memory=True, save_dir=None,
+              flow_gap_target=FLOW_GAP_TARGET):
+    results = []
+    for kind, params in cases:
+        name = network_name(kind, params)
+        graph, od_pairs = GENERATORS[kind](**params)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+            write_scenario(os.path.join(save_dir, name + BINARY_EXTENSION), graph, od_pairs,
+                           graph.graph["positions"])
+
+        for algorithm in algorithms:
+            # Each algorithm is cut at the target of its own gap measure.
+            measure = GAP_MEASURES[algorithm]
+            target = flow_gap_target if measure == "flow_gap" else target_gap
+            result = {"network": name, "generator": kind, "params": params, "algorithm": algorithm,
+                      "nodes": graph.number_of_nodes(), "edges": graph.number_of_edges(), "od_pairs": len(od_pairs),
+                      "gap_measure": measure, "target_gap": target}
+            result.update(run_case(algorithm, graph, od_pairs, target, max_iter))
+            if memory:
+                # tracemalloc slows allocation-heavy code down, so memory is
+                # measured in a separate run and never mixed into timings.
+                result["peak_memory_bytes"] = run_case(algorithm, graph, od_pairs, target, max_iter,
+                                                       trace_memory=True)["peak_memory_bytes"]
+            results.append(result)
+
+            to_target = f"{result['seconds_to_target']:.3f}s" if result["converged"] else "not reached"
+            per_iteration = result["mean_iteration_seconds"] or result["first_iteration_seconds"] or 0
+            memory_text = f"{result['peak_memory_bytes'] / 2 ** 20:8.1f} MiB" if memory else ""
+            print(f"{name:<40} {algorithm:<5} {result['iterations']:6d} it  {per_iteration * 1000:9.2f} ms/it  "
+                  f"target {to_target:<12} {memory_text}")
+    return results
+
+
+def edit_scenario(graph, od_pairs, seed=0):
+    # A typical editor change: one new link between nearby nodes that were
+    # not joined, and more demand on one OD pair.
+    rng = random.Random(seed)
+    graph = graph.copy()
+    od_pairs = ODMatrix.coerce(od_pairs).copy()
+    positions = graph.graph["positions"]
+    nodes = sorted(positions)
+    u = rng.choice(nodes)
+    v = min((node for node in nodes if node != u and not graph.has_edge(u, node)),
+            key=lambda node: math.dist(positions[u], positions[node]))
+    _add_link(graph, u, v, math.dist(positions[u], positions[v]), 0.2, 50.0)
+    origin, destination, _ = rng.choice(od_table(positions, len(nodes), 1.0, rng))
+    od_pairs.add(origin, destination, 10.0)
+    return graph, od_pairs
+
+
+def _solve_quietly(solver, graph, od_pairs, **options):
+    converged = []
+    monitor = Telemetry(callback=lambda event: converged.append(event["event"] == "converged"), quiet=True)
+    result = solver(graph, od_pairs, telemetry=monitor, **options)
+    return result, any(converged)
+
+
+def _objective(graph):
+    return sum(bpr_integral(data["weight"], data["volume"], data["capacity"]) for _, _, data in graph.edges(data=True))
+
+
+def _volume_difference(graph, result, reference):
+    difference = max(abs(result[u][v]["volume"] - reference[u][v]["volume"]) for u, v in graph.edges())
+    largest = max(data["volume"] for _, _, data in reference.edges(data=True))
+    return difference / largest if largest > 0 else 0.0
+
+
+def warm_start_check(cases, algorithms, tolerance=0.001, volume_tolerance=0.01, edits=WARM_CHECK_EDITS):
+    # Re-solving an edited network from the previous equilibrium has to end
+    # where a cold solve of the edited network does and take fewer
+    # iterations over the edits. At the default gaps link volumes are only
+    # settled to a few percent, so deterministic results are compared on
+    # the Beckmann objective, which the gap bounds; the stochastic mode's
+    # equilibrium minimises something else and is compared on volumes. A
+    # cold solve stopped by its iteration limit is not at an equilibrium to
+    # compare with.
+    failures = []
+    for kind, params in cases:
+        name = network_name(kind, params)
+        graph, od_pairs = GENERATORS[kind](**params)
+        for algorithm in algorithms:
+            solver = ASSIGNMENT_ALGORITHMS[algorithm]
+            stochastic = GAP_MEASURES[algorithm] == "flow_gap"
+            base, _ = _solve_quietly(solver, graph, od_pairs)
+            warm_start = {
+                "volumes": {(u, v): data["volume"] for u, v, data in base.edges(data=True)},
+                "od_pairs": ODMatrix.coerce(od_pairs).copy(),
+                "iterations": base.graph["iterations"],
+                "relative_gap": base.graph["relative_gap"],
+                "origin_flows": base.graph.get("origin_flows"),
+            }
+            cold_iterations = warm_iterations = 0
+            for seed in range(edits):
+                edited_graph, edited_od_pairs = edit_scenario(graph, od_pairs, seed)
+                cold, converged = _solve_quietly(solver, edited_graph, edited_od_pairs)
+                warm, _ = _solve_quietly(solver, edited_graph, edited_od_pairs, warm_start=warm_start)
+                cold_iterations += cold.graph["iterations"]
+                warm_iterations += warm.graph["iterations"]
+
+                if stochastic:
+                    measure, limit = "volume", volume_tolerance
+                    difference = _volume_difference(edited_graph, warm, cold)
+                else:
+                    measure, limit = "objective", tolerance
+                    difference = abs(_objective(warm) - _objective(cold)) / _objective(cold)
+                if not converged:
+                    status = "cold not converged"
+                elif difference > limit:
+                    status = "MISMATCH"
+                    failures.append((name, algorithm, seed, measure, difference))
+                else:
+                    status = "ok"
+                print(f"{name:<40} {algorithm:<5} edit {seed}  cold {cold.graph['iterations']:6d} it  "
+                      f"warm {warm.graph['iterations']:6d} it  {measure} difference {difference:.3%}  {status}")
+
+            fewer = warm_iterations < cold_iterations
+            if not fewer:
+                failures.append((name, algorithm, None, "iterations", warm_iterations / cold_iterations))
+            print(f"{name:<40} {algorithm:<5} total   cold {cold_iterations:6d} it  warm {warm_iterations:6d} it  "
+                  f"{'ok' if fewer else 'NOT FEWER'}")
+    return failures
+
+
+def compare_results(results, baseline, tolerance):
+    previous = {(r["network"], r["algorithm"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["network"], result["algorithm"]))
+        if old is None:
+            continue
+        for metric in ("seconds_to_target", "mean_iteration_seconds", "peak_memory_bytes"):
+            if old.get(metric) and result.get(metric):
+                ratio = result[metric] / old[metric]
+                if ratio > 1 + tolerance:
+                    regressions.append((result["network"], result["algorithm"], metric, ratio))
+        if old.get("converged") and not result["converged"]:
+            regressions.append((result["network"], result["algorithm"], "converged", 0.0))
+
+    for network, algorithm, metric, ratio in regressions:
+        detail = "no longer reaches the target gap" if metric == "converged" else f"{ratio:.2f}x slower/larger"
+        print(f"REGRESSION {network} {algorithm} {metric}: {detail}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the assignment algorithms on synthetic networks.")
+    parser.add_argument("-s", "--suite", default="small", choices=list(SUITES))
+    parser.add_argument("-a", "--algorithms", nargs="+", default=list(ASSIGNMENT_ALGORITHMS),
+                        choices=list(ASSIGNMENT_ALGORITHMS))
+    parser.add_argument("-g", "--target-gap", type=float, default=1e-4)
+    parser.add_argument("--flow-gap", type=float, default=FLOW_GAP_TARGET,
+                        help="target of the flow gap the stochastic (sue) mode reports")
+    parser.add_argument("-n", "--max-iter", type=int, default=1000)
+    parser.add_argument("-o", "--output", help="results file (default: benchmark_results/<suite>-<time>.json)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--save-dir", help="also write the generated networks as binary scenarios")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging a regression")
+    parser.add_argument("--warm-check", action="store_true",
+                        help="only check that warm-started re-solves after edits match cold solves in fewer iterations")
+    args = parser.parse_args()
+
+    if args.warm_check:
+        if warm_start_check(SUITES[args.suite], args.algorithms):
+            raise SystemExit(1)
+        return
+
+    results = run_suite(SUITES[args.suite], args.algorithms, args.target_gap, args.max_iter, not args.no_memory,
+                        args.save_dir, args.flow_gap)
+
+    output = args.output or os.path.join("benchmark_results", f"{args.suite}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "suite": args.suite,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "results": results,
+        }, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import math
+
+import numpy as np
+
+from compiled_network import CompiledNetwork
+from multiclass import ClassDemand, vehicle_classes_for
+from od_matrix import ODMatrix
+from parallel_loading import create_loader
+from real_graphs import beckmann_objective, bpr, bpr_derivative, relative_gap, write_result
+from shortest_paths import shortest_path_tree
+from telemetry import Telemetry
+
+# Bush flows below this are rounding residue from earlier shifts and are
+# treated as unused, otherwise they pin zero-size shifts on longest paths.
+FLOW_EPSILON = 1e-11
+
+# Sweeps over all bushes go on while each still shifts at least this share
+# of the flow the pass after growing the bushes shifted, up to the sweeps
+# limit of an iteration.
+SWEEP_SHARE = 0.5
+
+
+class Bush:
+    def __init__(self, net, origin, destinations, demands, cost, flows=None):
+        _, self.head, self.tail = net.adjacency()
+        self.origin = origin
+        self.n_nodes = net.n_nodes
+        self.flow = dict(flows) if flows else {}
+        cost = cost.tolist()
+
+        # Nodes the bush does not reach yet hang off it through their
+        # shortest-path tree edge; those edges never point back into the
+        # bush, so it stays acyclic.
+        order, pred_edge, _ = shortest_path_tree(net, origin, cost)
+        covered = {origin}.union(self.head[e] for e in self.flow)
+        for node in order:
+            if node not in covered:
+                self.flow[pred_edge[node]] = 0.0
+
+        self.nodes = order
+        self._sort()
+
+        _, min_pred, _, _ = self.labels(cost, used_only=False)
+        node_flow = [0.0] * net.n_nodes
+        for d, q in zip(destinations.tolist(), demands.tolist()):
+            node_flow[d] += q
+        for node in reversed(self.order):
+            q = node_flow[node]
+            if q and node != origin:
+                e = min_pred[node]
+                self.flow[e] += q
+                node_flow[self.tail[e]] += q
+
+    def _sort(self):
+        self.in_edges = {node: [] for node in self.nodes}
+        self.out_edges = {node: [] for node in self.nodes}
+        indegree = dict.fromkeys(self.nodes, 0)
+        for e in self.flow:
+            self.in_edges[self.head[e]].append(e)
+            self.out_edges[self.tail[e]].append(e)
+            indegree[self.head[e]] += 1
+
+        self.order = []
+        stack = [self.origin]
+        while stack:
+            node = stack.pop()
+            self.order.append(node)
+            for e in self.out_edges[node]:
+                v = self.head[e]
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    stack.append(v)
+        self.position = {node: i for i, node in enumerate(self.order)}
+
+    def _reaches(self, source, target):
+        limit = self.position[target]
+        seen = {source}
+        stack = [source]
+        while stack:
+            node = stack.pop()
+            if node == target:
+                return True
+            for e in self.out_edges[node]:
+                v = self.head[e]
+                if v not in seen and self.position[v] <= limit:
+                    seen.add(v)
+                    stack.append(v)
+        return False
+
+    def labels(self, cost, used_only):
+        min_dist = [math.inf] * self.n_nodes
+        max_dist = [math.inf] * self.n_nodes
+        min_pred = [-1] * self.n_nodes
+        max_pred = [-1] * self.n_nodes
+        min_dist[self.origin] = max_dist[self.origin] = 0.0
+
+        for node in self.order[1:]:
+            best, best_edge = math.inf, -1
+            worst, worst_edge = -math.inf, -1
+            for e in self.in_edges[node]:
+                i = self.tail[e]
+                d = min_dist[i] + cost[e]
+                if d < best:
+                    best, best_edge = d, e
+                if not used_only or self.flow[e] > FLOW_EPSILON:
+                    d = max_dist[i] + cost[e]
+                    if d > worst:
+                        worst, worst_edge = d, e
+            if worst_edge == -1:
+                worst, worst_edge = best, best_edge
+            min_dist[node], min_pred[node] = best, best_edge
+            max_dist[node], max_pred[node] = worst, worst_edge
+
+        return min_dist, min_pred, max_dist, max_pred
+
+    def improve(self, net, cost, cost_array):
+        _, min_pred, _, _ = self.labels(cost, used_only=False)
+        for e in [e for e, flow in self.flow.items() if flow <= FLOW_EPSILON and min_pred[self.head[e]] != e]:
+            del self.flow[e]
+        self._sort()
+
+        # A shortcut that follows the current topological order can always
+        # be added; one that runs against it only if it closes no cycle.
+        min_dist, _, _, _ = self.labels(cost, used_only=False)
+        min_dist = np.array(min_dist)
+        shortcuts = np.flatnonzero(min_dist[net.tail] + cost_array < min_dist[net.head])
+
+        added = False
+        for e in shortcuts.tolist():
+            # Costs computed elementwise and vectorized can differ in the
+            # last bit, which makes links already in the bush look shorter.
+            if e in self.flow:
+                continue
+            i, j = self.tail[e], self.head[e]
+            if self.position[i] < self.position[j]:
+                self.flow[e] = 0.0
+                self.in_edges[j].append(e)
+                self.out_edges[i].append(e)
+                added = True
+            elif not self._reaches(j, i):
+                self.flow[e] = 0.0
+                self._sort()
+                added = True
+        return added
+
+    def _segments(self, node, min_pred, max_pred):
+        # Both paths are walked back from the node, always stepping the one
+        # further along the topological order, until they meet where they
+        # diverge, instead of walking the whole shortest path back to the
+        # origin for every node.
+        max_segment, min_segment = [max_pred[node]], [min_pred[node]]
+        i, j = self.tail[max_pred[node]], self.tail[min_pred[node]]
+        position = self.position
+        while i != j:
+            if position[i] > position[j]:
+                e = max_pred[i]
+                max_segment.append(e)
+                i = self.tail[e]
+            else:
+                e = min_pred[j]
+                min_segment.append(e)
+                j = self.tail[e]
+
+        return min_segment, max_segment
+
+    def equilibrate(self, volume, cost, derivative, free_time, capacity):
+        min_dist, min_pred, max_dist, max_pred = self.labels(cost, used_only=True)
+        shifted = 0.0
+
+        for node in reversed(self.order):
+            if min_pred[node] == max_pred[node] or max_dist[node] <= min_dist[node]:
+                continue
+
+            min_segment, max_segment = self._segments(node, min_pred, max_pred)
+            cost_gap = sum(cost[e] for e in max_segment) - sum(cost[e] for e in min_segment)
+            if cost_gap <= 0:
+                continue
+
+            shift = min(self.flow[e] for e in max_segment)
+            slope = sum(derivative[e] for e in max_segment) + sum(derivative[e] for e in min_segment)
+            if slope > 0:
+                shift = min(shift, cost_gap / slope)
+            if shift <= 0:
+                continue
+
+            for e, sign in [(e, -1) for e in max_segment] + [(e, 1) for e in min_segment]:
+                flow = self.flow[e] + sign * shift
+                volume[e] = max(volume[e] + flow - self.flow[e], 0.0)
+                self.flow[e] = flow if flow > FLOW_EPSILON else 0.0
+                cost[e] = bpr(free_time[e], volume[e], capacity[e])
+                derivative[e] = bpr_derivative(free_time[e], volume[e], capacity[e])
+            shifted += shift
+
+        return shifted
+
+
+def warm_start_bushes(net, od_pairs, warm_start):
+    if not warm_start or not warm_start.get("origin_flows"):
+        return None
+
+    added_demand = net.demand_increase(od_pairs, warm_start["od_pairs"])
+    if added_demand is None:
+        return None
+
+    origin_flows = {}
+    for origin, flows in warm_start["origin_flows"].items():
+        if origin not in net.node_index:
+            return None
+        edge_flows = {}
+        for key, flow in flows.items():
+            if key in net.edge_index:
+                edge_flows[net.edge_index[key]] = flow
+            elif flow > 0:
+                return None
+        origin_flows[net.node_index[origin]] = edge_flows
+
+    volume = np.zeros(net.n_edges)
+    for flows in origin_flows.values():
+        for e, flow in flows.items():
+            volume[e] += flow
+    travel_time = bpr(net.free_time, volume, net.capacity)
+
+    added_by_origin = {origin: (destinations, demands) for origin, destinations, demands in added_demand}
+    no_demand = (np.zeros(0, dtype=np.int64), np.zeros(0))
+    origins = list(origin_flows) + [origin for origin in added_by_origin if origin not in origin_flows]
+
+    return [Bush(net, origin, *added_by_origin.get(origin, no_demand), travel_time, origin_flows.get(origin))
+            for origin in origins]
+
+
+def algorithm_b(graph, od_pairs, max_iter=200, gap_threshold=1e-10, sweeps=100, warm_start=None, progress=None,
+                workers=1, telemetry=None, vehicle_classes=None):
+    g = graph.copy()
+    net = CompiledNetwork(g)
+    return write_result(g, net, solve_algorithm_b(net, od_pairs, vehicle_classes_for(g, vehicle_classes), max_iter,
+                                                  gap_threshold, sweeps, warm_start, progress, workers, telemetry))
+
+
+def solve_algorithm_b(net, od_pairs, vehicle_classes, max_iter=200, gap_threshold=1e-10, sweeps=100, warm_start=None,
+                      progress=None, workers=1, telemetry=None):
+    od_pairs = ODMatrix.coerce(od_pairs)
+    if ClassDemand(net, od_pairs, vehicle_classes).multiclass:
+        raise ValueError("Algorithm B only supports single-class demand on unrestricted links")
+    demand = net.group_demand(od_pairs)
+    telemetry = telemetry or Telemetry()
+
+    free_time = net.free_time.tolist()
+    capacity = net.capacity.tolist()
+
+    with telemetry.solve("algb", net, len(demand)):
+        with telemetry.phase("bushes"):
+            bushes = warm_start_bushes(net, od_pairs, warm_start)
+            if bushes is None:
+                bushes = [Bush(net, origin, destinations, demands, net.free_time)
+                          for origin, destinations, demands in demand]
+
+        volume = [0.0] * net.n_edges
+        for bush in bushes:
+            for e, flow in bush.flow.items():
+                volume[e] += flow
+
+        cost = [bpr(free_time[e], volume[e], capacity[e]) for e in range(net.n_edges)]
+        derivative = [bpr_derivative(free_time[e], volume[e], capacity[e]) for e in range(net.n_edges)]
+
+        with create_loader(net, demand, workers) as loader:
+            for n_iter in range(1, max_iter + 1):
+                with telemetry.phase("cost_update"):
+                    volume_array = np.array(volume)
+                    travel_time = bpr(net.free_time, volume_array, net.capacity)
+                with telemetry.phase("shortest_paths"):
+                    auxiliary_flows = loader.load(travel_time)
+
+                rel_gap = relative_gap(volume_array, auxiliary_flows, travel_time)
+                converged = rel_gap < gap_threshold
+
+                if not converged:
+                    cost_array = travel_time
+                    grown = 0.0
+                    for bush in bushes:
+                        with telemetry.phase("bushes"):
+                            bush.improve(net, cost, cost_array)
+                        with telemetry.phase("equilibrate"):
+                            grown += bush.equilibrate(volume, cost, derivative, free_time, capacity)
+                        cost_array = np.array(cost)
+
+                    # Repeated sweeps over all bushes let origins that share
+                    # links settle against each other before the bushes are
+                    # grown again. Early on the flow each sweep shifts falls
+                    # off fast and growing the bushes again does more; close
+                    # to equilibrium every sweep shifts about as much as the
+                    # pass after growing them, and the sweeps run on up to
+                    # the limit instead of regrowing after a handful.
+                    with telemetry.phase("equilibrate"):
+                        for _ in range(sweeps):
+                            shifted = sum(bush.equilibrate(volume, cost, derivative, free_time, capacity)
+                                          for bush in bushes)
+                            if shifted <= SWEEP_SHARE * grown:
+                                break
+
+                new_volume = np.array(volume)
+                max_diff = float(np.abs(new_volume - volume_array).max(initial=0))
+                telemetry.iteration(n_iter, rel_gap, max_diff, beckmann_objective(net, new_volume))
+                if progress:
+                    progress(n_iter, rel_gap)
+
+                if converged:
+                    telemetry.converged(n_iter)
+                    break
+
+    volume = np.array(volume)
+    return {"volume": volume, "travel_time": bpr(net.free_time, volume, net.capacity),
+            "iterations": n_iter, "relative_gap": rel_gap,
+            "origin_flows": {net.nodes[bush.origin]: {net.edge_keys[e]: flow for e, flow in bush.flow.items()}
+                             for bush in bushes}}
@@ -0,0 +1,47 @@
+import argparse
+import json
+import subprocess
+import sys
+
+SOLVER_MODULES = ["telemetry", "od_matrix", "compiled_network", "shortest_paths", "parallel_loading", "multiclass",
+                  "real_graphs", "bush_assignment", "assignment", "periods", "traffic"]
+HEAVY_MODULES = ["matplotlib", "networkx", "pygame"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module):
+    # A fresh interpreter per module, so nothing is already cached in
+    # sys.modules and the number matches what a new pool worker pays.
+    output = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the solver modules.")
+    parser.add_argument("--budget", type=float, default=0.5, help="maximum seconds per module import")
+    args = parser.parse_args()
+
+    failed = False
+    for module in SOLVER_MODULES:
+        result = measure_import(module)
+        problems = []
+        if result["seconds"] > args.budget:
+            problems.append(f"over {args.budget:.2f}s budget")
+        if result["heavy"]:
+            problems.append(f"imports {', '.join(result['heavy'])}")
+        failed = failed or bool(problems)
+        print(f"{module:<20} {result['seconds'] * 1000:8.1f} ms  {'; '.join(problems) or 'ok'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
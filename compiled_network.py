@@ -0,0 +1,148 @@
+import numpy as np
+
+from od_matrix import ODMatrix
+
+
+class CompiledNetwork:
+    def __init__(self, graph):
+        nodes = list(graph.nodes())
+        node_index = {node: i for i, node in enumerate(nodes)}
+        edges = list(graph.edges(data=True))
+        self._build(nodes, node_index,
+                    np.array([node_index[u] for u, _, _ in edges], dtype=np.int64),
+                    np.array([node_index[v] for _, v, _ in edges], dtype=np.int64),
+                    np.array([d["weight"] for _, _, d in edges], dtype=float),
+                    np.array([d["capacity"] for _, _, d in edges], dtype=float),
+                    [d.get("classes") for _, _, d in edges])
+
+    @classmethod
+    def from_arrays(cls, nodes, tail, head, free_time, capacity, edge_classes=None):
+        # Compiles link arrays, e.g. those of a binary scenario, without
+        # going through a networkx graph.
+        net = object.__new__(cls)
+        nodes = list(nodes)
+        net._build(nodes, {node: i for i, node in enumerate(nodes)}, np.asarray(tail, dtype=np.int64),
+                   np.asarray(head, dtype=np.int64), np.asarray(free_time, dtype=float),
+                   np.asarray(capacity, dtype=float), edge_classes or [None] * len(tail))
+        return net
+
+    def _build(self, nodes, node_index, tail, head, free_time, capacity, edge_classes):
+        self.nodes = nodes
+        self.node_index = node_index
+        self.n_nodes = len(nodes)
+        order = np.argsort(tail, kind="stable")
+
+        # Edges are stored grouped by tail node, so the out-edges of node i are
+        # the contiguous slice indptr[i]:indptr[i + 1] of every edge array.
+        self.tail = tail[order]
+        self.head = head[order]
+        self.edge_keys = [(nodes[u], nodes[v]) for u, v in zip(self.tail.tolist(), self.head.tolist())]
+        self.edge_index = {key: i for i, key in enumerate(self.edge_keys)}
+        self.n_edges = len(self.edge_keys)
+        self.indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.tail, minlength=self.n_nodes), out=self.indptr[1:])
+
+        self.free_time = free_time[order]
+        self.capacity = capacity[order]
+        # Links without a "classes" attribute are open to every vehicle class.
+        self.edge_classes = [edge_classes[i] for i in order.tolist()]
+
+        self.volume = np.zeros(self.n_edges)
+        self.travel_time = self.free_time.copy()
+
+        self._adjacency = None
+
+    def without_edges(self, closed):
+        # The same network with some links removed; nodes keep their indices
+        # and the remaining links keep their order.
+        keep = np.ones(self.n_edges, dtype=bool)
+        keep[list(closed)] = False
+        net = object.__new__(CompiledNetwork)
+        net.nodes, net.node_index, net.n_nodes = self.nodes, self.node_index, self.n_nodes
+        net.edge_keys = [key for key, kept in zip(self.edge_keys, keep.tolist()) if kept]
+        net.edge_index = {key: i for i, key in enumerate(net.edge_keys)}
+        net.n_edges = len(net.edge_keys)
+        net.tail = self.tail[keep]
+        net.head = self.head[keep]
+        net.indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(net.tail, minlength=self.n_nodes), out=net.indptr[1:])
+        net.free_time = self.free_time[keep]
+        net.capacity = self.capacity[keep]
+        net.edge_classes = [classes for classes, kept in zip(self.edge_classes, keep.tolist()) if kept]
+        net.volume = np.zeros(net.n_edges)
+        net.travel_time = net.free_time.copy()
+        net._adjacency = None
+        return net
+
+    def reverse(self):
+        # The same network with every link turned around, for searches
+        # towards a node; order[i] is the original index of reversed link i.
+        order = np.argsort(self.head, kind="stable")
+        net = object.__new__(CompiledNetwork)
+        net.nodes, net.node_index, net.n_nodes = self.nodes, self.node_index, self.n_nodes
+        net.edge_keys = [(v, u) for u, v in (self.edge_keys[i] for i in order.tolist())]
+        net.edge_index = {key: i for i, key in enumerate(net.edge_keys)}
+        net.n_edges = self.n_edges
+        net.tail = self.head[order]
+        net.head = self.tail[order]
+        net.indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(net.tail, minlength=self.n_nodes), out=net.indptr[1:])
+        net.free_time = self.free_time[order]
+        net.capacity = self.capacity[order]
+        net.edge_classes = [self.edge_classes[i] for i in order.tolist()]
+        net.volume = self.volume[order]
+        net.travel_time = self.travel_time[order]
+        net._adjacency = None
+        return net, order
+
+    def adjacency(self):
+        # Plain lists index much faster than NumPy arrays inside the Python
+        # shortest-path loops, so they are built once and reused.
+        if self._adjacency is None:
+            self._adjacency = (self.indptr.tolist(), self.head.tolist(), self.tail.tolist())
+        return self._adjacency
+
+    def class_permissions(self, class_names):
+        masks = []
+        for name in class_names:
+            allowed = np.array([classes is None or name in classes for classes in self.edge_classes], dtype=bool)
+            masks.append(None if allowed.all() else allowed)
+        return masks
+
+    def demand_totals(self, od_pairs):
+        totals = {}
+        for origin, row in ODMatrix.coerce(od_pairs).combined().items():
+            if origin in self.node_index:
+                totals[self.node_index[origin]] = {self.node_index[destination]: demand
+                                                   for destination, demand in row.items()
+                                                   if destination in self.node_index}
+        return totals
+
+    def group_demand(self, od_pairs):
+        return self._group(self.demand_totals(od_pairs))
+
+    def demand_increase(self, od_pairs, previous_od_pairs):
+        totals = self.demand_totals(od_pairs)
+        previous = self.demand_totals(previous_od_pairs)
+        if any(demand > totals.get(origin, {}).get(destination, 0) + 1e-9
+               for origin, row in previous.items() for destination, demand in row.items()):
+            return None
+
+        increase = {}
+        for origin, row in totals.items():
+            before = previous.get(origin, {})
+            increase[origin] = {destination: demand - before.get(destination, 0) for destination, demand in row.items()
+                                if demand - before.get(destination, 0) > 1e-12}
+        return self._group(increase)
+
+    @staticmethod
+    def _group(totals):
+        return [(origin, np.fromiter(destinations.keys(), dtype=np.int64, count=len(destinations)),
+                 np.fromiter(destinations.values(), dtype=float, count=len(destinations)))
+                for origin, destinations in totals.items() if destinations]
+
+    def write_back(self, graph):
+        for (u, v), volume, travel_time in zip(self.edge_keys, self.volume.tolist(), self.travel_time.tolist()):
+            data = graph[u][v]
+            data["volume"] = volume
+            data["travel_time"] = travel_time
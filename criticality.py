@@ -0,0 +1,223 @@
+import argparse
+import csv
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bush_assignment import FLOW_EPSILON, solve_algorithm_b
+from compiled_network import CompiledNetwork
+from multiclass import vehicle_classes_for
+from od_matrix import ODMatrix
+from scenario import read_scenario
+from shortest_paths import shortest_path_tree
+from telemetry import Telemetry
+
+CRITICALITY_FIELDS = ["rank", "from", "to", "base_volume", "total_travel_time", "increase", "relative_increase",
+                      "status", "iterations", "relative_gap", "unserved_demand"]
+
+_worker = {}
+
+
+def total_travel_time(result):
+    return float(result["volume"] @ result["travel_time"])
+
+
+def remove_link_flow(origin, flows, closed, tail, head):
+    # The flow an origin sends over the closed link is traced back to the
+    # origin and on to its destinations, splitting at every node in
+    # proportion to the origin's own link flows. What is left is still a
+    # valid bush flow, short of the demand returned per destination.
+    amount = flows.get(closed, 0.0)
+    if amount <= FLOW_EPSILON:
+        return {e: flow for e, flow in flows.items() if e != closed and flow > FLOW_EPSILON}, {}
+
+    # Zero-flow bush links are kept so that every bush node is ordered.
+    in_edges, out_edges, inflow, outflow = {}, {}, {}, {}
+    for e, flow in flows.items():
+        in_edges.setdefault(head[e], []).append(e)
+        out_edges.setdefault(tail[e], []).append(e)
+        inflow[head[e]] = inflow.get(head[e], 0.0) + flow
+        outflow[tail[e]] = outflow.get(tail[e], 0.0) + flow
+
+    indegree = {node: len(edges) for node, edges in in_edges.items()}
+    order = []
+    stack = [origin]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        for e in out_edges.get(node, ()):
+            indegree[head[e]] -= 1
+            if indegree[head[e]] == 0:
+                stack.append(head[e])
+
+    removed = {closed: amount}
+    lost = {}
+    through = {head[closed]: amount}
+    for node in order[order.index(head[closed]):]:
+        if through.get(node, 0.0) <= 0:
+            continue
+        share = through[node] / inflow[node]
+        absorbed = share * (inflow[node] - outflow.get(node, 0.0))
+        if absorbed > FLOW_EPSILON:
+            lost[node] = absorbed
+        for e in out_edges.get(node, ()):
+            removed[e] = removed.get(e, 0.0) + share * flows[e]
+            through[head[e]] = through.get(head[e], 0.0) + share * flows[e]
+
+    back = {tail[closed]: amount}
+    for node in reversed(order[:order.index(tail[closed]) + 1]):
+        if node == origin or back.get(node, 0.0) <= 0:
+            continue
+        share = back[node] / inflow[node]
+        for e in in_edges[node]:
+            removed[e] = removed.get(e, 0.0) + share * flows[e]
+            back[tail[e]] = back.get(tail[e], 0.0) + share * flows[e]
+
+    remaining = {}
+    for e, flow in flows.items():
+        flow -= removed.get(e, 0.0)
+        if e != closed and flow > FLOW_EPSILON:
+            remaining[e] = flow
+    return remaining, lost
+
+
+def _init_worker(net, od_pairs, vehicle_classes, origin_flows, options):
+    _worker.update(net=net, od_pairs=od_pairs, vehicle_classes=vehicle_classes, origin_flows=origin_flows,
+                   options=options)
+
+
+def _close_link(closed):
+    net = _worker["net"]
+    closed_net = net.without_edges([closed])
+    tail, head = net.tail.tolist(), net.head.tolist()
+
+    # The closure starts from the base equilibrium: every origin keeps its
+    # flows except those that used the closed link, and only that demand is
+    # loaded again.
+    served = _worker["od_pairs"].copy()
+    origin_flows = {}
+    unserved = 0.0
+    for origin, flows in _worker["origin_flows"].items():
+        remaining, lost = remove_link_flow(origin, flows, closed, tail, head)
+        origin_flows[net.nodes[origin]] = {net.edge_keys[e]: flow for e, flow in remaining.items()}
+        if not lost:
+            continue
+        _, _, dist = shortest_path_tree(closed_net, origin, closed_net.free_time.tolist(), lost)
+        for destination, demand in lost.items():
+            served.add(net.nodes[origin], net.nodes[destination], -demand)
+            if math.isinf(dist[destination]):
+                unserved += demand
+
+    if unserved > 0:
+        return {"status": "disconnected", "total_travel_time": math.inf, "iterations": 0, "relative_gap": None,
+                "unserved_demand": unserved}
+
+    result = solve_algorithm_b(closed_net, _worker["od_pairs"], _worker["vehicle_classes"],
+                               warm_start={"origin_flows": origin_flows, "od_pairs": served},
+                               telemetry=Telemetry(quiet=True), **_worker["options"])
+    return {"status": "ok", "total_travel_time": total_travel_time(result), "iterations": result["iterations"],
+            "relative_gap": result["relative_gap"], "unserved_demand": 0.0}
+
+
+def link_criticality(graph, od_pairs, links=None, top=None, workers=None, progress=None, telemetry=None,
+                     max_iter=200, gap_threshold=1e-6, vehicle_classes=None):
+    net = CompiledNetwork(graph)
+    od_pairs = ODMatrix.coerce(od_pairs)
+    vehicle_classes = vehicle_classes_for(graph, vehicle_classes)
+    options = {"max_iter": max_iter, "gap_threshold": gap_threshold}
+
+    # Closures are warm-started from origin-based flows, so the base
+    # equilibrium is found with Algorithm B.
+    base = solve_algorithm_b(net, od_pairs, vehicle_classes, telemetry=telemetry or Telemetry(quiet=True), **options)
+    base_total = total_travel_time(base)
+    origin_flows = {net.node_index[origin]: {net.edge_index[key]: flow for key, flow in flows.items()}
+                    for origin, flows in base["origin_flows"].items()}
+
+    candidates = [net.edge_index[key] for key in links] if links is not None else list(range(net.n_edges))
+    if top is not None:
+        candidates = sorted(candidates, key=lambda e: -base["volume"][e])[:top]
+
+    # Removing a link no origin uses leaves the base flows in equilibrium,
+    # so those closures are not solved.
+    outcomes = {}
+    closures = []
+    for e in candidates:
+        if base["volume"][e] > FLOW_EPSILON:
+            closures.append(e)
+        else:
+            outcomes[e] = {"status": "unused", "total_travel_time": base_total, "iterations": 0,
+                           "relative_gap": base["relative_gap"], "unserved_demand": 0.0}
+
+    workers = min(workers or multiprocessing.cpu_count(), len(closures))
+    initargs = (net, od_pairs, vehicle_classes, origin_flows, options)
+    if workers <= 1:
+        _init_worker(*initargs)
+        for e in closures:
+            outcomes[e] = _close_link(e)
+            if progress:
+                progress(len(outcomes), len(candidates))
+    elif closures:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = {pool.submit(_close_link, e): e for e in closures}
+            try:
+                for future in as_completed(futures):
+                    outcomes[futures[future]] = future.result()
+                    if progress:
+                        progress(len(outcomes), len(candidates))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    table = []
+    for e, outcome in outcomes.items():
+        increase = outcome["total_travel_time"] - base_total
+        u, v = net.edge_keys[e]
+        row = {"from": u, "to": v, "base_volume": float(base["volume"][e]), "increase": increase,
+               "relative_increase": increase / base_total if base_total > 0 else 0.0}
+        row.update(outcome)
+        table.append(row)
+
+    table.sort(key=lambda row: -row["increase"])
+    for rank, row in enumerate(table, 1):
+        row["rank"] = rank
+    return table
+
+
+def write_criticality(filepath, table):
+    with open(filepath, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CRITICALITY_FIELDS)
+        writer.writeheader()
+        writer.writerows(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank links by the increase in total travel time when closed.")
+    parser.add_argument("scenario", help="scenario file (.json, .scn or *_net.tntp)")
+    parser.add_argument("-o", "--output", default="criticality.csv")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--top", type=int, default=None, help="only close the links with the highest base volume")
+    parser.add_argument("-g", "--gap", type=float, default=1e-6, help="relative gap each closure is solved to")
+    parser.add_argument("-n", "--max-iter", type=int, default=200)
+    args = parser.parse_args()
+
+    graph, od_pairs = read_scenario(args.scenario)
+    start = time.perf_counter()
+
+    def progress(done, total):
+        if done == total or done % 50 == 0:
+            print(f"[{done}/{total}] closures solved ({time.perf_counter() - start:.1f}s)")
+
+    table = link_criticality(graph, od_pairs, top=args.top, workers=args.processes, progress=progress,
+                             max_iter=args.max_iter, gap_threshold=args.gap)
+    write_criticality(args.output, table)
+
+    for row in table[:10]:
+        print(f"{row['rank']:4d}  {row['from']}-{row['to']}  +{row['increase']:.2f} "
+              f"({row['relative_increase']:.2%})  {row['status']}")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,36 @@
-import io
-import json
 import os
 
-import matplotlib.pyplot as plt
 import networkx as nx
-import pygame
+
+from compiled_network import CompiledNetwork
+from layout import LayoutCache
+from multiclass import vehicle_classes_for
+from od_matrix import DEFAULT_CLASS, ODMatrix
+from result_cache import ResultCache
+from result_export import EXPORT_FORMATS, export_history, export_links
+from routing import LandmarkIndex
+from scenario import BINARY_EXTENSION, read_scenario, write_scenario
+
+SCENARIO_EXTENSIONS = ('.json', BINARY_EXTENSION, '.tntp')
 
 
 class GraphManager:
     def __init__(self):
         self.graph = nx.DiGraph()
-        self.od_pairs = []
-        self.buf = io.BytesIO()
+        self.od_pairs = ODMatrix()
+        self.periods = {}
+        self.last_solution = None
+        self.last_result = None
+        self.last_history = []
+        self.result_cache = ResultCache()
+        self.layout = LayoutCache()
+        self.renderer = None
+        self._index = None
+        # Bumped on every edit of the network or its solution, so derived
+        # indexes know when they are out of date.
+        self._graph_version = 0
+        self._solution_version = 0
+        self._routes = {}
         self.save_directory = "saved_graphs"
 
     def add_node(self, node):
@@ -22,6 +41,7 @@ class GraphManager:
             return False, f"Node '{node}' already exists"
 
         self.graph.add_node(node)
+        self._graph_version += 1
         return True, f"Node '{node}' added"
 
     def add_edge(self, node1, node2, weight=1, capacity=100):
@@ -29,130 +49,177 @@ class GraphManager:
             return False, "One or both nodes don't exist"
 
         self.graph.add_edge(node1, node2, weight=weight, capacity=capacity)
+        self._graph_version += 1
         return True, f"Edge between '{node1}' and '{node2}' added"
 
-    def add_od_pair(self, origin, destination, demand):
+    def add_od_pair(self, origin, destination, demand, vehicle_class=DEFAULT_CLASS, period=None):
         if origin not in self.graph.nodes or destination not in self.graph.nodes:
             return False, "Origin or destination node doesn't exist"
 
+        if vehicle_class not in vehicle_classes_for(self.graph):
+            return False, f"Unknown vehicle class '{vehicle_class}'"
+
         try:
             demand_value = float(demand)
             if demand_value <= 0:
                 return False, "Demand must be positive"
 
-            self.od_pairs.append((origin, destination, demand_value))
+            od_pairs = self.od_pairs if period is None else self.periods.setdefault(period, ODMatrix())
+            total = od_pairs.add(origin, destination, demand_value, vehicle_class)
+            if total != demand_value:
+                return True, f"OD pair {origin}-{destination} demand increased to {total}"
             return True, f"OD pair {origin}-{destination} with demand {demand_value} added"
         except ValueError:
             return False, "Invalid demand value"
 
     def clear_graph(self):
         self.graph.clear()
-        self.od_pairs = []
+        self.od_pairs = ODMatrix()
+        self.periods = {}
+        self.last_solution = None
+        self.last_result = None
+        self._graph_version += 1
+        self._solution_version += 1
+        self.layout.clear()
         return "Graph cleared"
 
-    def find_shortest_path(self, origin, destination):
-        try:
-            return nx.shortest_path(self.graph, source=origin, target=destination, weight='weight')
-        except nx.NetworkXNoPath:
+    def store_solution(self, result_graph, od_pairs, history=None):
+        self._solution_version += 1
+        self.last_result = result_graph
+        self.last_history = history or []
+        if "period_names" in result_graph.graph:
+            # Each period is warm-started from its own previous result.
+            self.last_solution = {"periods": {
+                name: {
+                    "volumes": {(u, v): data["period_volumes"][name] for u, v, data in result_graph.edges(data=True)},
+                    "od_pairs": ODMatrix.coerce(od_pairs[name]).copy(),
+                    "iterations": result_graph.graph["period_results"][name]["iterations"],
+                    "relative_gap": result_graph.graph["period_results"][name]["relative_gap"],
+                } for name in result_graph.graph["period_names"]}}
+            return
+
+        self.last_solution = {
+            "volumes": {(u, v): data["volume"] for u, v, data in result_graph.edges(data=True)},
+            "od_pairs": ODMatrix.coerce(od_pairs).copy(),
+            "iterations": result_graph.graph.get("iterations", 0),
+            "relative_gap": result_graph.graph.get("relative_gap"),
+            "origin_flows": result_graph.graph.get("origin_flows"),
+            "travel_times": {(u, v): data["travel_time"] for u, v, data in result_graph.edges(data=True)
+                             if "travel_time" in data},
+        }
+
+    def routing_index(self, weight='weight'):
+        # The landmark index takes a few full trees to build, so it is kept
+        # until the network changes, or for travel times, the solution.
+        version = (self._graph_version, self._solution_version if weight == 'travel_time' else None)
+        cached = self._routes.get(weight)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        net = CompiledNetwork(self.graph)
+        cost = net.free_time
+        if weight == 'travel_time':
+            # Links without a solved travel time, e.g. ones added since the
+            # last run, fall back to their free-flow time.
+            travel_times = (self.last_solution or {}).get("travel_times") or {}
+            cost = [travel_times.get(key, net.free_time[e]) for e, key in enumerate(net.edge_keys)]
+        elif weight != 'weight':
+            cost = [self.graph[u][v][weight] for u, v in net.edge_keys]
+
+        index = LandmarkIndex(net, cost)
+        self._routes[weight] = (version, index)
+        return index
+
+    def find_shortest_path(self, origin, destination, weight='weight'):
+        if origin not in self.graph.nodes or destination not in self.graph.nodes:
             return None
+        return self.routing_index(weight).shortest_path(origin, destination)
 
-    def create_graph_image(self, width, height):
-        plt.close('all')
+    def spatial_index(self, positions):
+        from viewport import SpatialIndex
 
-        try:
-            fig, ax = plt.subplots(figsize=(12, 8), dpi=150)
-            ax.set_facecolor('#f8f9fa')
-
-            if self.graph.number_of_nodes() > 0:
-                pos = nx.spring_layout(self.graph, seed=42)
-                nx.draw_networkx_nodes(self.graph, pos, node_color='#3498db', node_size=700,
-                                       edgecolors='#2980b9')
-
-                nx.draw_networkx_edges(self.graph, pos, edge_color='#95a5a6', width=2.5, arrows=True)
-
-                for origin, destination, demand in self.od_pairs:
-                    if origin in pos and destination in pos:
-                        rad = 0.3
-                        edge_color = '#e74c3c'
-
-                        nx.draw_networkx_edges(
-                            nx.DiGraph([((origin, destination))]),
-                            pos,
-                            edge_color=edge_color,
-                            width=2.0,
-                            arrows=True,
-                            arrowstyle='-|>',
-                            arrowsize=15,
-                            connectionstyle=f'arc3,rad={rad}',
-                            alpha=0.8
-                        )
-
-                        edge_x = (pos[origin][0] + pos[destination][0]) / 2
-                        edge_y = (pos[origin][1] + pos[destination][1]) / 2
-                        offset_x = (pos[destination][1] - pos[origin][1]) * rad / 2
-                        offset_y = (pos[origin][0] - pos[destination][0]) * rad / 2
-
-                        plt.text(edge_x + offset_x, edge_y + offset_y,
-                                 f"D={demand}",
-                                 color=edge_color,
-                                 fontsize=10,
-                                 bbox=dict(boxstyle="round,pad=0.2", fc="white", ec=edge_color, alpha=0.8))
-
-                nx.draw_networkx_labels(self.graph, pos, font_color='white', font_size=14, font_weight='bold')
-
-                edge_labels = {(u, v): f"t={data['weight']}\nc={data.get('capacity', 'N/A')}"
-                               for u, v, data in self.graph.edges(data=True)}
-                nx.draw_networkx_edge_labels(self.graph, pos, edge_labels=edge_labels, font_size=12,
-                                             font_color='#34495e',
-                                             bbox=dict(boxstyle="round,pad=0.3", ec="#cccccc", fc="white"))
-
-            ax.set_axis_off()
-
-            buffer = io.BytesIO()
-            fig.tight_layout()
-            fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
-            buffer.seek(0)
-
-            image = pygame.image.load(buffer)
-            scaled_image = pygame.transform.scale(image, (width, height))
-
-            buffer.close()
-            plt.close(fig)
-
-            return scaled_image
+        if self._index is None or self._index.positions is not positions:
+            self._index = SpatialIndex(positions, self.graph.edges())
+        return self._index
+
+    def _edge_label(self, u, v):
+        data = self.graph.edges[u, v]
+        return f"t={data['weight']}", f"c={data.get('capacity', 'N/A')}"
 
+    def create_graph_image(self, width, height, viewport=None, scroll=None):
+        from renderer import NetworkRenderer
+
+        try:
+            if self.renderer is None or self.renderer.size != (width, height):
+                self.renderer = NetworkRenderer(width, height)
+
+            if scroll:
+                # Panning never edits the graph, so the cached layout is
+                # still current and the topology check can be skipped.
+                positions = self.layout.positions
+            else:
+                positions = self.layout.get(self.graph) if self.graph.number_of_nodes() > 0 else {}
+            index = None
+            if viewport is not None:
+                viewport.resize(width, height)
+                if viewport.auto_fit:
+                    viewport.fit(positions)
+                index = self.spatial_index(positions)
+
+            if scroll:
+                self.renderer.scroll(self.graph, positions, *scroll, self.od_pairs, self._edge_label,
+                                     viewport=viewport, index=index)
+            else:
+                self.renderer.draw(self.graph, positions, self.od_pairs, self._edge_label, viewport=viewport,
+                                   index=index)
+
+            return self.renderer.surface
         except Exception as e:
             print(f"Error creating graph image: {e}")
-            plt.close('all')
             return None
 
     def save_graph(self, filename):
         if not filename:
             return False, "Filename cannot be empty"
 
-        if not filename.endswith('.json'):
+        if not filename.endswith(SCENARIO_EXTENSIONS):
             filename += '.json'
 
         filepath = os.path.join(self.save_directory, filename)
 
-        graph_data = {
-            'nodes': list(self.graph.nodes()),
-            'edges': [(u, v, d) for u, v, d in self.graph.edges(data=True)],
-            'od_pairs': self.od_pairs
-        }
-
         try:
-            with open(filepath, 'w') as f:
-                json.dump(graph_data, f, indent=2)
+            write_scenario(filepath, self.graph, self.od_pairs, self.layout.get(self.graph), self.periods)
             return True, f"Graph saved to {filename}"
         except Exception as e:
             return False, f"Error saving graph: {str(e)}"
 
+    def export_results(self, filename):
+        if self.last_result is None:
+            return False, "No results to export, run a calculation first"
+        if not filename:
+            return False, "Filename cannot be empty"
+
+        # Links and iteration history go to two files next to each other,
+        # in the format the extension names; CSV unless one is given.
+        base, extension = os.path.splitext(filename)
+        if extension.lower() not in EXPORT_FORMATS:
+            base, extension = filename, '.csv'
+        links_path = os.path.join(self.save_directory, f"{base}_links{extension}")
+        history_path = os.path.join(self.save_directory, f"{base}_history{extension}")
+
+        try:
+            os.makedirs(self.save_directory, exist_ok=True)
+            rows = export_links(links_path, self.last_result)
+            iterations = export_history(history_path, self.last_history)
+            return True, f"Exported {rows} link rows and {iterations} iterations to {base}_*{extension}"
+        except Exception as e:
+            return False, f"Error exporting results: {str(e)}"
+
     def load_graph(self, filename):
         if not filename:
             return False, "Filename cannot be empty"
 
-        if not filename.endswith('.json'):
+        if not filename.endswith(SCENARIO_EXTENSIONS):
             filename += '.json'
 
         filepath = os.path.join(self.save_directory, filename)
@@ -161,18 +228,19 @@ class GraphManager:
             return False, f"File {filename} not found"
 
         try:
-            with open(filepath, 'r') as f:
-                graph_data = json.load(f)
+            graph, od_pairs = read_scenario(filepath)
+            positions = graph.graph.pop('positions', None)
+            periods = graph.graph.pop('periods', {})
 
             self.graph.clear()
-            self.od_pairs = []
-
-            self.graph.add_nodes_from(graph_data['nodes'])
-
-            for u, v, d in graph_data['edges']:
-                self.graph.add_edge(u, v, **d)
-
-            self.od_pairs = graph_data['od_pairs']
+            self.graph.update(graph)
+            self.od_pairs = od_pairs
+            self.periods = periods
+            self.last_solution = None
+            self.last_result = None
+            self._graph_version += 1
+            self._solution_version += 1
+            self.layout.load(self.graph, positions)
 
             return True, f"Graph loaded from {filename}"
         except Exception as e:
@@ -181,4 +249,5 @@ class GraphManager:
     def get_saved_graphs(self):
         if not os.path.exists(self.save_directory):
             return []
-        return [f for f in os.listdir(self.save_directory) if f.endswith('.json')]
+        return [f for f in os.listdir(self.save_directory)
+                if f.endswith(SCENARIO_EXTENSIONS) and not f.endswith('_trips.tntp')]
@@ -1,5 +1,7 @@
 import pygame
 
+from viewport import Viewport
+
 
 class InputBox:
     def __init__(self, x, y, w, h, text='', placeholder=''):
@@ -75,11 +77,17 @@ class Button:
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
 
+    def set_text(self, text):
+        self.text = text
+        self.txt_surface = self.font.render(text, True, pygame.Color(255, 255, 255))
+
 
 class Window:
-    def __init__(self, graph_manager):
+    def __init__(self, graph_manager, algorithms=("msa",)):
         pygame.init()
         self.graph_manager = graph_manager
+        self.algorithms = list(algorithms)
+        self.algorithm = self.algorithms[0]
         self.window = pygame.display.set_mode((1200, 1000))
         self.screen = pygame.display.get_surface()
         pygame.display.set_caption('Road Network Visualizer')
@@ -97,6 +105,9 @@ class Window:
         self.status_message = ""
         self.status_color = self.text_color
         self.graph_image = None
+        self.progress = None
+        self.viewport = Viewport(self.graph_area.width, self.graph_area.height)
+        self.dragging = False
 
         self._init_ui_elements()
 
@@ -119,14 +130,52 @@ class Window:
         self.filename_input = InputBox(1020, 770, 150, 35, placeholder="Graph")
         self.save_button = Button(1020, 810, 150, 35, "Save Graph")
         self.load_button = Button(1020, 850, 150, 35, "Load Graph")
+        self.export_button = Button(1020, 890, 150, 35, "Export Results")
 
+        self.algorithm_button = Button(600, 850, 170, 35, f"Algorithm: {self.algorithm.upper()}")
         self.calculate_button = Button(600, 890, 170, 35, "Calculate")
 
-    def draw_graph(self):
-        self.graph_image = self.graph_manager.create_graph_image(self.graph_area.width, self.graph_area.height)
+    def draw_graph(self, scroll=None):
+        self.graph_image = self.graph_manager.create_graph_image(self.graph_area.width, self.graph_area.height,
+                                                                 self.viewport, scroll)
         self.screen.blit(self.graph_image, (self.graph_area.x, self.graph_area.y))
         pygame.draw.rect(self.screen, self.accent_color, self.graph_area, 2, border_radius=10)
 
+    def reset_view(self):
+        self.viewport.auto_fit = True
+        self.draw_graph()
+
+    def handle_view_event(self, event):
+        if event.type == pygame.MOUSEWHEEL:
+            x, y = pygame.mouse.get_pos()
+            if not self.graph_area.collidepoint(x, y):
+                return False
+            if self.viewport.zoom_at(1.2 ** event.y, x - self.graph_area.x, y - self.graph_area.y):
+                self.draw_graph()
+            return True
+
+        if event.type == pygame.MOUSEBUTTONDOWN and self.graph_area.collidepoint(event.pos):
+            if event.button == 1:
+                self.dragging = True
+            return True
+
+        if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.dragging:
+            self.dragging = False
+            return True
+
+        if event.type == pygame.MOUSEMOTION and self.dragging:
+            dx, dy = event.rel
+            if dx or dy:
+                self.viewport.pan(dx, dy)
+                self.draw_graph(scroll=(dx, dy))
+            return True
+
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_HOME:
+            self.reset_view()
+            return True
+
+        return False
+
     def add_node(self, node):
         success, message = self.graph_manager.add_node(node)
         self._set_status(message, not success)
@@ -144,7 +193,7 @@ class Window:
     def clear_graph(self):
         message = self.graph_manager.clear_graph()
         self._set_status(message, None)
-        self.draw_graph()
+        self.reset_view()
 
     def add_od_pair(self, origin, destination, demand):
         success, message = self.graph_manager.add_od_pair(origin, destination, demand)
@@ -153,6 +202,31 @@ class Window:
             self.draw_graph()
         return success
 
+    def cycle_algorithm(self):
+        index = (self.algorithms.index(self.algorithm) + 1) % len(self.algorithms)
+        self.algorithm = self.algorithms[index]
+        self.algorithm_button.set_text(f"Algorithm: {self.algorithm.upper()}")
+        self._set_status(f"Assignment algorithm set to {self.algorithm.upper()}")
+
+    def set_progress(self, iteration, gap, fraction):
+        self.progress = (iteration, gap, fraction)
+        self.calculate_button.set_text("Cancel")
+
+    def clear_progress(self):
+        self.progress = None
+        self.calculate_button.set_text("Calculate")
+
+    def _draw_progress(self):
+        iteration, gap, fraction = self.progress
+        bar = pygame.Rect(720, 953, 250, 14)
+        pygame.draw.rect(self.screen, self.bg_color, bar, border_radius=4)
+        filled = bar.copy()
+        filled.w = int(bar.w * min(max(fraction, 0.0), 1.0))
+        pygame.draw.rect(self.screen, self.accent_color, filled, border_radius=4)
+        pygame.draw.rect(self.screen, self.accent_color, bar, 1, border_radius=4)
+        label = f"Iter {iteration}  gap {gap:.2e}" if gap is not None else f"Iter {iteration}"
+        self._draw_text(label, 980, 950)
+
     def _set_status(self, message, is_error=None):
         self.status_message = message
         if is_error is None:
@@ -205,17 +279,23 @@ class Window:
         self._draw_text("Demand:", 700, 855)
         self.demand_input.draw(self.screen)
 
+        self.algorithm_button.draw(self.screen)
         self.calculate_button.draw(self.screen)
 
         self.add_od_button.draw(self.screen)
 
         self._draw_text(f"OD Pairs: {len(self.graph_manager.od_pairs)}", 600, 950)
+        if self.graph_manager.periods:
+            self._draw_text(f"Periods: {len(self.graph_manager.periods)}", 600, 928)
         self._draw_text(self.status_message, 50, 950, self.status_color)
+        if self.progress:
+            self._draw_progress()
 
         self._draw_text("SAVE & LOAD", 600, 745, self.accent_color)
         self.filename_input.draw(self.screen)
         self.save_button.draw(self.screen)
         self.load_button.draw(self.screen)
+        self.export_button.draw(self.screen)
 
     def _draw_text(self, text, x, y, color=None):
         text_surface = self.font.render(text, True, color or self.text_color)
@@ -226,9 +306,14 @@ class Window:
         self._set_status(message, not success)
         return success
 
+    def export_results(self, filename):
+        success, message = self.graph_manager.export_results(filename)
+        self._set_status(message, not success)
+        return success
+
     def load_saved_graph(self, filename):
         success, message = self.graph_manager.load_graph(filename)
         if success:
-            self.draw_graph()
+            self.reset_view()
         self._set_status(message, not success)
         return success
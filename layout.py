@@ -0,0 +1,111 @@
+import math
+import random
+import statistics
+from itertools import islice
+
+import networkx as nx
+
+
+class LayoutCache:
+    def __init__(self, seed=42, relax_iterations=10):
+        self.seed = seed
+        self.relax_iterations = relax_iterations
+        self.positions = {}
+        self._key = None
+        self._edges = set()
+        # Nodes this cache laid out itself, rather than took from a scenario
+        # file, which may still move as their links change.
+        self._placed = set()
+
+    @staticmethod
+    def topology_key(graph):
+        return hash((tuple(graph.nodes()), tuple(graph.edges())))
+
+    def clear(self):
+        self.positions = {}
+        self._key = None
+        self._edges = set()
+        self._placed = set()
+
+    def load(self, graph, positions):
+        if positions and all(node in positions for node in graph):
+            self.positions = {node: (float(x), float(y)) for node, (x, y) in positions.items() if node in graph}
+            self._key = self.topology_key(graph)
+            self._edges = set(graph.edges())
+            self._placed = set()
+        else:
+            self.clear()
+
+    def _place(self, graph, node, known, bounds=(-1, -1, 1, 1), spread=1.0):
+        neighbours = [known[n] for n in nx.all_neighbors(graph, node) if n in known]
+        rng = random.Random(f"{self.seed}:{node}")
+        if neighbours:
+            x = sum(p[0] for p in neighbours) / len(neighbours)
+            y = sum(p[1] for p in neighbours) / len(neighbours)
+            return x + rng.uniform(-0.05, 0.05) * spread, y + rng.uniform(-0.05, 0.05) * spread
+        return rng.uniform(bounds[0], bounds[2]), rng.uniform(bounds[1], bounds[3])
+
+    @staticmethod
+    def _link_length(graph, positions, sample=1000):
+        lengths = [math.dist(positions[u], positions[v]) for u, v in islice(graph.edges(), sample)
+                   if u in positions and v in positions]
+        length = statistics.median(lengths) if lengths else 0.0
+        return length if length > 0 else None
+
+    def get(self, graph):
+        key = self.topology_key(graph)
+        if key == self._key:
+            return self.positions
+
+        known = {node: self.positions[node] for node in graph if node in self.positions}
+        edges = set(graph.edges())
+        if not known:
+            positions = nx.spring_layout(graph, seed=self.seed) if graph.number_of_nodes() > 0 else {}
+            self._placed = set(graph)
+        else:
+            # Existing nodes keep their coordinates and the layout its scale;
+            # only nodes this cache laid out itself are relaxed, once they are
+            # new or their links change, so an edit costs the same on any
+            # size of network.
+            new = [node for node in graph if node not in known]
+            link_length = self._link_length(graph, known)
+            spread = link_length or 1.0
+            xs, ys = zip(*known.values())
+            bounds = (min(xs), min(ys), max(xs), max(ys))
+            if bounds[0] == bounds[2] or bounds[1] == bounds[3]:
+                # A single node or a straight line gives no area to place in.
+                bounds = (bounds[0] - spread, bounds[1] - spread, bounds[2] + spread, bounds[3] + spread)
+            for node in new:
+                known[node] = self._place(graph, node, known, bounds, spread)
+            positions = known
+            self._placed = (self._placed & known.keys()) | set(new)
+
+            changed = {node for edge in edges ^ self._edges for node in edge if node in self._placed}
+            moving = changed.union(new)
+            region = moving.union(*(nx.all_neighbors(graph, node) for node in moving))
+            subgraph = graph.subgraph(region)
+            if subgraph.number_of_edges():
+                fixed = [node for node in region if node not in moving]
+                start = {node: known[node] for node in region}
+                if fixed:
+                    relaxed = nx.spring_layout(subgraph, pos=start, fixed=fixed, k=link_length,
+                                               iterations=self.relax_iterations, seed=self.seed)
+                else:
+                    # Nothing holds the region in place, so it is kept where
+                    # and as large as it was.
+                    xs, ys = zip(*start.values())
+                    center = (statistics.fmean(xs), statistics.fmean(ys))
+                    scale = max(max(abs(x - center[0]) for x in xs), max(abs(y - center[1]) for y in ys)) or spread
+                    relaxed = nx.spring_layout(subgraph, pos=start, k=link_length, scale=scale, center=center,
+                                               iterations=self.relax_iterations, seed=self.seed)
+                positions.update((node, relaxed[node]) for node in moving)
+
+        self.positions = {node: (float(x), float(y)) for node, (x, y) in positions.items()}
+        self._key = key
+        self._edges = edges
+        return self.positions
+
+    def lookup(self, graph):
+        if all(node in self.positions for node in graph):
+            return {node: self.positions[node] for node in graph}
+        return self.get(graph)
@@ -1,8 +1,12 @@
+from functools import partial
+
 import pygame
 
+from assignment import ASSIGNMENT_ALGORITHMS, TARGET_GAPS
+from assignment_worker import AssignmentWorker
 from graph_operations import GraphManager
 from interface import Window
-from real_graphs import msa
+from periods import solve_periods
 from result_overlay import ResultOverlay
 
 
@@ -12,20 +16,55 @@ def clear_input_boxes(boxes):
         box._update_surface()
 
 
-def run_msa_calculation(graph, od_pairs, result_overlay, window):
+def start_msa_calculation(graph, od_pairs, window, algorithm="msa", periods=None):
     calculation_graph = graph.copy()
+    cache = window.graph_manager.result_cache
+
+    if periods:
+        solver = cache.wrap(partial(solve_periods, algorithm=algorithm), algorithm, periods=True)
+        demand = {name: matrix.copy() for name, matrix in periods.items()}
+    else:
+        solver, demand = cache.wrap(ASSIGNMENT_ALGORITHMS[algorithm], algorithm), od_pairs.copy()
+
+    worker = AssignmentWorker(solver, calculation_graph, demand, warm_start=window.graph_manager.last_solution,
+                              target_gap=TARGET_GAPS[algorithm])
+    worker.start()
+    window.set_progress(0, None, 0.0)
+    return worker
+
+
+def handle_worker_messages(worker, result_overlay, window):
+    for message in worker.poll():
+        kind = message[0]
+        if kind == "progress":
+            _, iteration, gap = message
+            window.set_progress(iteration, gap, worker.progress_fraction(gap))
+            continue
+
+        window.clear_progress()
+        if kind == "done":
+            result_graph = message[1]
+            window.graph_manager.store_solution(result_graph, worker.od_pairs, worker.telemetry.history)
+            result_overlay.prepare_result(result_graph, window.window.get_width(), window.window.get_height(),
+                                          window.graph_manager.layout.lookup(result_graph))
+            iterations = result_graph.graph.get('iterations', 0)
+            if result_graph.graph.get("cached"):
+                window._set_status(f"Loaded cached result ({iterations} iterations)", is_error=False)
+            else:
+                window._set_status(f"Calculation finished after {iterations} iterations", is_error=False)
+        elif kind == "cancelled":
+            window._set_status("Calculation cancelled")
+        else:
+            window._set_status(f"Calculation failed: {message[1]}", is_error=True)
+        return None
 
-    formatted_od_pairs = [(origin, destination, demand) for origin, destination, demand in od_pairs]
-
-    result_graph = msa(calculation_graph, formatted_od_pairs)
-
-    result_overlay.prepare_result(result_graph, window.window.get_width(), window.window.get_height())
+    return worker
 
 
 def main():
     graph_manager = GraphManager()
 
-    window = Window(graph_manager)
+    window = Window(graph_manager, algorithms=list(ASSIGNMENT_ALGORITHMS))
     result_overlay = ResultOverlay()
     window.draw_graph()
 
@@ -35,8 +74,16 @@ def main():
     file_inputs = [window.filename_input]
     all_inputs = node_inputs + edge_inputs + od_inputs + file_inputs
 
+    worker = None
+    clock = pygame.time.Clock()
+
     running = True
     while running:
+        clock.tick(60)
+
+        if worker:
+            worker = handle_worker_messages(worker, result_overlay, window)
+
         if not result_overlay.visible:
             window.draw_ui()
         else:
@@ -49,6 +96,9 @@ def main():
             if event.type == pygame.QUIT:
                 running = False
 
+            if worker and event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                worker.cancel()
+
             if result_overlay.visible:
                 if result_overlay.handle_event(event):
                     continue
@@ -57,6 +107,9 @@ def main():
                 for box in all_inputs:
                     box.handle_event(event)
 
+                if window.handle_view_event(event):
+                    continue
+
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if window.add_node_button.is_clicked(event.pos):
                         if window.add_node(window.node_input.text):
@@ -85,20 +138,37 @@ def main():
                     elif window.save_button.is_clicked(event.pos):
                         window.save_current_graph(window.filename_input.text)
 
+                    elif window.export_button.is_clicked(event.pos):
+                        window.export_results(window.filename_input.text)
+
                     elif window.load_button.is_clicked(event.pos):
                         if window.load_saved_graph(window.filename_input.text):
                             clear_input_boxes([window.filename_input])
 
+                    elif window.algorithm_button.is_clicked(event.pos):
+                        window.cycle_algorithm()
+
                     elif window.calculate_button.is_clicked(event.pos):
-                        if graph_manager.graph.number_of_nodes() > 0 and len(graph_manager.od_pairs) > 0:
-                            window._set_status("Running MSA calculation...")
-                            run_msa_calculation(graph_manager.graph, graph_manager.od_pairs, result_overlay, window)
+                        if worker:
+                            worker.cancel()
+                            window._set_status("Cancelling calculation...")
+                        elif graph_manager.graph.number_of_nodes() > 0 and graph_manager.periods:
+                            window._set_status(f"Running {window.algorithm.upper()} calculation for "
+                                               f"{len(graph_manager.periods)} periods...")
+                            worker = start_msa_calculation(graph_manager.graph, graph_manager.od_pairs, window,
+                                                           window.algorithm, graph_manager.periods)
+                        elif graph_manager.graph.number_of_nodes() > 0 and len(graph_manager.od_pairs) > 0:
+                            window._set_status(f"Running {window.algorithm.upper()} calculation...")
+                            worker = start_msa_calculation(graph_manager.graph, graph_manager.od_pairs, window,
+                                                           window.algorithm)
                         else:
                             window._set_status("Cannot calculate: Graph or OD pairs missing", is_error=True)
 
                 for box in all_inputs:
                     box.update()
 
+    if worker:
+        worker.cancel()
     pygame.quit()
 
 
@@ -0,0 +1,97 @@
+import numpy as np
+
+from od_matrix import DEFAULT_CLASS, ODMatrix
+from parallel_loading import create_loader
+
+# Passenger-car equivalents; a scenario can override them through the
+# "vehicle_classes" graph attribute.
+DEFAULT_VEHICLE_CLASSES = {"car": 1.0, "truck": 2.5, "bus": 2.0}
+
+
+def vehicle_classes_for(graph, vehicle_classes=None):
+    return dict(DEFAULT_VEHICLE_CLASSES, **(vehicle_classes or graph.graph.get("vehicle_classes") or {}))
+
+
+class ClassDemand:
+    def __init__(self, net, od_pairs, vehicle_classes):
+        od_pairs = ODMatrix.coerce(od_pairs)
+        for name in od_pairs.classes():
+            if name not in vehicle_classes:
+                raise ValueError(f"Unknown vehicle class '{name}'")
+
+        self.names = od_pairs.classes() or [DEFAULT_CLASS]
+        self.pce = np.array([vehicle_classes[name] for name in self.names], dtype=float)
+        self.n_edges = net.n_edges
+        masks = net.class_permissions(self.names)
+        self.restricted = any(mask is not None for mask in masks)
+
+        # Classes allowed on the same links see the same costs, so they share
+        # one shortest-path tree per origin and are loaded on it together.
+        groups = {}
+        for c, mask in enumerate(masks):
+            key = None if mask is None else mask.tobytes()
+            groups.setdefault(key, (mask, []))[1].append(c)
+
+        self.groups = []
+        for mask, classes in groups.values():
+            by_origin = {}
+            for k, c in enumerate(classes):
+                for origin, row in od_pairs.rows(self.names[c]):
+                    if origin not in net.node_index:
+                        continue
+                    cells = by_origin.setdefault(net.node_index[origin], {})
+                    for destination, demand in row.items():
+                        if destination in net.node_index:
+                            cells.setdefault(net.node_index[destination], [0.0] * len(classes))[k] += demand
+
+            demand = []
+            for origin, destinations in by_origin.items():
+                demand.append((origin, np.fromiter(destinations.keys(), dtype=np.int64, count=len(destinations)),
+                               np.array(list(destinations.values()), dtype=float).T.copy()))
+            self.groups.append((mask, np.array(classes, dtype=np.int64), demand))
+
+    @property
+    def multiclass(self):
+        return self.names != [DEFAULT_CLASS] or self.restricted
+
+    def __len__(self):
+        return sum(len(demand) for _, _, demand in self.groups)
+
+    def loader(self, net, workers=1, theta=None):
+        return ClassLoader(self, net, workers, theta)
+
+    def class_names(self):
+        # Per-class volumes are only reported when they say more than the
+        # total volume does.
+        return list(self.names) if self.multiclass else None
+
+
+def write_class_volumes(graph, net, class_names, class_volume):
+    for (u, v), volumes in zip(net.edge_keys, class_volume.T.tolist()):
+        graph[u][v]["class_volumes"] = dict(zip(class_names, volumes))
+    graph.graph["class_names"] = list(class_names)
+
+
+class ClassLoader:
+    def __init__(self, demand, net, workers, theta=None):
+        self.shape = (len(demand.names), net.n_edges)
+        self._parts = [(mask, classes, create_loader(net, grouped, workers, len(classes), theta))
+                       for mask, classes, grouped in demand.groups if grouped]
+
+    def load(self, cost):
+        # Vehicles per class and link; links a class may not use cost it
+        # infinity, so its trees never take them.
+        flows = np.zeros(self.shape)
+        for mask, classes, loader in self._parts:
+            flows[classes] = loader.load(cost if mask is None else np.where(mask, cost, np.inf))
+        return flows
+
+    def close(self):
+        for _, _, loader in self._parts:
+            loader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
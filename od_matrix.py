@@ -0,0 +1,106 @@
+import numpy as np
+
+DEFAULT_CLASS = "car"
+
+
+class ODMatrix:
+    def __init__(self, pairs=()):
+        # vehicle class -> origin -> destination -> demand; only non-zero
+        # cells are stored and repeated pairs are summed on insert.
+        self._cells = {}
+        self.update(pairs)
+
+    @classmethod
+    def coerce(cls, od_pairs):
+        return od_pairs if isinstance(od_pairs, cls) else cls(od_pairs)
+
+    @classmethod
+    def from_csr(cls, nodes, indptr, destinations, demands, classes=None, class_names=(DEFAULT_CLASS,)):
+        matrix = cls()
+        indptr = indptr.tolist()
+        destinations = [nodes[d] for d in destinations.tolist()]
+        demands = demands.tolist()
+        classes = classes.tolist() if classes is not None else None
+        for o, node in enumerate(nodes):
+            start, end = indptr[o], indptr[o + 1]
+            if start == end:
+                continue
+            if classes is None:
+                matrix._cells.setdefault(class_names[0], {})[node] = dict(zip(destinations[start:end],
+                                                                              demands[start:end]))
+                continue
+            for k in range(start, end):
+                matrix.add(node, destinations[k], demands[k], class_names[classes[k]])
+        return matrix
+
+    def add(self, origin, destination, demand, vehicle_class=DEFAULT_CLASS):
+        row = self._cells.setdefault(vehicle_class, {}).setdefault(origin, {})
+        row[destination] = row.get(destination, 0) + demand
+        return row[destination]
+
+    def update(self, pairs):
+        for pair in pairs:
+            self.add(*pair)
+
+    def get(self, origin, destination, vehicle_class=DEFAULT_CLASS):
+        return self._cells.get(vehicle_class, {}).get(origin, {}).get(destination, 0)
+
+    def classes(self):
+        return sorted(self._cells, key=lambda name: (name != DEFAULT_CLASS, name))
+
+    def rows(self, vehicle_class=DEFAULT_CLASS):
+        return self._cells.get(vehicle_class, {}).items()
+
+    def origins(self):
+        return {origin for rows in self._cells.values() for origin in rows}
+
+    def combined(self):
+        # Demand of every class summed per cell, in vehicles.
+        if len(self._cells) <= 1:
+            return next(iter(self._cells.values()), {})
+        totals = {}
+        for rows in self._cells.values():
+            for origin, row in rows.items():
+                merged = totals.setdefault(origin, {})
+                for destination, demand in row.items():
+                    merged[destination] = merged.get(destination, 0) + demand
+        return totals
+
+    def total(self):
+        return sum(sum(row.values()) for rows in self._cells.values() for row in rows.values())
+
+    def copy(self):
+        matrix = ODMatrix()
+        matrix._cells = {name: {origin: dict(row) for origin, row in rows.items()}
+                         for name, rows in self._cells.items()}
+        return matrix
+
+    def to_csr(self, node_index, class_index=None):
+        # One row per node; within a row, cells are ordered by destination
+        # index and then class index.
+        cells = []
+        for name in self.classes():
+            c = class_index[name] if class_index else 0
+            for origin, row in self.rows(name):
+                o = node_index[origin]
+                cells.extend((o, node_index[destination], c, demand) for destination, demand in row.items())
+        cells.sort()
+
+        origins = np.array([cell[0] for cell in cells], dtype=np.int64)
+        indptr = np.zeros(len(node_index) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(origins, minlength=len(node_index)), out=indptr[1:])
+        return (indptr, np.array([cell[1] for cell in cells], dtype=np.int64),
+                np.array([cell[3] for cell in cells], dtype=float),
+                np.array([cell[2] for cell in cells], dtype=np.int64))
+
+    def __len__(self):
+        return sum(len(row) for rows in self._cells.values() for row in rows.values())
+
+    def __iter__(self):
+        for name in self.classes():
+            for origin, row in self._cells[name].items():
+                for destination, demand in row.items():
+                    if name == DEFAULT_CLASS:
+                        yield origin, destination, demand
+                    else:
+                        yield origin, destination, demand, name
@@ -0,0 +1,134 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from shortest_paths import all_or_nothing, logit_loading
+
+_worker = {}
+
+
+class SharedNetwork:
+    def __init__(self, indptr, head, tail):
+        self.n_nodes = len(indptr) - 1
+        self.n_edges = len(head)
+        self._adjacency = (indptr.tolist(), head.tolist(), tail.tolist())
+
+    def adjacency(self):
+        return self._adjacency
+
+
+def load_flows(net, demand, cost, n_classes=None, theta=None):
+    # Deterministic loading puts all demand on the shortest path; with a
+    # logit dispersion theta it is spread over the efficient paths.
+    if theta is None:
+        return all_or_nothing(net, demand, cost, n_classes)
+    return logit_loading(net, demand, cost, theta, n_classes)
+
+
+def _init_worker(layout, demand_chunks, n_classes, theta):
+    arrays = {}
+    for key, (name, shape, dtype) in layout.items():
+        block = shared_memory.SharedMemory(name=name)
+        _worker.setdefault("blocks", []).append(block)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    _worker["net"] = SharedNetwork(arrays["indptr"], arrays["head"], arrays["tail"])
+    _worker["cost"] = arrays["cost"]
+    _worker["flows"] = arrays["flows"]
+    _worker["demand"] = demand_chunks
+    _worker["n_classes"] = n_classes
+    _worker["theta"] = theta
+
+
+def _load_chunk(index):
+    # Each chunk owns one accumulator row, so workers never write to the
+    # same memory and only the chunk index crosses the process boundary.
+    _worker["flows"][index] = load_flows(_worker["net"], _worker["demand"][index], _worker["cost"],
+                                         _worker["n_classes"], _worker["theta"])
+    return index
+
+
+class SerialLoader:
+    def __init__(self, net, demand, n_classes=None, theta=None):
+        self.net = net
+        self.demand = demand
+        self.n_classes = n_classes
+        self.theta = theta
+
+    def load(self, cost):
+        return load_flows(self.net, self.demand, cost, self.n_classes, self.theta)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ParallelLoader:
+    def __init__(self, net, demand, workers, n_classes=None, theta=None):
+        chunks = self._split(demand, workers)
+        self.n_chunks = len(chunks)
+
+        self._blocks = []
+        layout = {}
+        for key, source in (("indptr", net.indptr), ("head", net.head), ("tail", net.tail)):
+            self._share(key, source, layout)
+        self.cost = self._share("cost", np.zeros(net.n_edges), layout)
+        flow_shape = (n_classes, net.n_edges) if n_classes else (net.n_edges,)
+        self.flows = self._share("flows", np.zeros((self.n_chunks,) + flow_shape), layout)
+
+        # The network and the demand split are handed over once, when the
+        # pool starts; each iteration only writes costs to shared memory.
+        self._pool = multiprocessing.Pool(self.n_chunks, initializer=_init_worker,
+                                          initargs=(layout, chunks, n_classes, theta))
+
+    def _share(self, key, source, layout):
+        block = shared_memory.SharedMemory(create=True, size=max(source.nbytes, 1))
+        self._blocks.append(block)
+        array = np.ndarray(source.shape, dtype=source.dtype, buffer=block.buf)
+        array[...] = source
+        layout[key] = (block.name, source.shape, source.dtype.str)
+        return array
+
+    @staticmethod
+    def _split(demand, workers):
+        chunks = [[] for _ in range(workers)]
+        loads = [0] * workers
+        for item in sorted(demand, key=lambda item: len(item[1]), reverse=True):
+            i = loads.index(min(loads))
+            chunks[i].append(item)
+            loads[i] += len(item[1]) + 1
+        return [chunk for chunk in chunks if chunk] or [[]]
+
+    def load(self, cost):
+        self.cost[:] = cost
+        self._pool.map(_load_chunk, range(self.n_chunks), chunksize=1)
+        return self.flows.sum(axis=0)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        self.cost = self.flows = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create_loader(net, demand, workers=1, n_classes=None, theta=None):
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers > 1 and len(demand) > 1:
+        return ParallelLoader(net, demand, min(workers, len(demand)), n_classes, theta)
+    return SerialLoader(net, demand, n_classes, theta)
@@ -0,0 +1,140 @@
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
+
+from assignment import NETWORK_SOLVERS
+from compiled_network import CompiledNetwork
+from multiclass import vehicle_classes_for
+from od_matrix import ODMatrix
+from real_graphs import write_result
+from telemetry import Telemetry
+
+_worker = {}
+
+
+class PeriodCancelled(Exception):
+    pass
+
+
+def _init_worker(net, vehicle_classes, messages, cancelled):
+    # Results travel back through the futures, and everything left on the
+    # queue after a cancellation may be dropped.
+    messages.cancel_join_thread()
+    _worker.update(net=net, vehicle_classes=vehicle_classes, messages=messages, cancelled=cancelled)
+
+
+def _solve_period(algorithm, name, od_pairs, warm_start, options):
+    messages, cancelled = _worker["messages"], _worker["cancelled"]
+
+    def progress(iteration, gap):
+        if cancelled.is_set():
+            raise PeriodCancelled()
+        messages.put(("progress", name, iteration, gap))
+
+    telemetry = Telemetry(callback=lambda event: messages.put(("event", name, event)), quiet=True)
+    try:
+        return NETWORK_SOLVERS[algorithm](_worker["net"], od_pairs, _worker["vehicle_classes"], warm_start=warm_start,
+                                          progress=progress, telemetry=telemetry, **options)
+    finally:
+        # Every message of a period is on the queue before this one, so the
+        # caller knows when it has seen all of them.
+        messages.put(("done", name))
+
+
+def solve_periods(graph, periods, algorithm="bfw", warm_start=None, progress=None, workers=None, telemetry=None,
+                  vehicle_classes=None, **options):
+    g = graph.copy()
+    net = CompiledNetwork(g)
+    results = solve_network_periods(net, periods, vehicle_classes_for(g, vehicle_classes), algorithm, warm_start,
+                                    progress, workers, telemetry, **options)
+    names = list(results)
+
+    write_result(g, net, results[names[0]])
+    g.graph.pop("origin_flows", None)
+
+    volumes = {name: results[name]["volume"].tolist() for name in names}
+    travel_times = {name: results[name]["travel_time"].tolist() for name in names}
+    for e, (u, v) in enumerate(net.edge_keys):
+        data = g[u][v]
+        data["period_volumes"] = {name: volumes[name][e] for name in names}
+        data["period_travel_times"] = {name: travel_times[name][e] for name in names}
+
+    g.graph["period_names"] = names
+    g.graph["period_results"] = {name: {"iterations": results[name]["iterations"],
+                                        "relative_gap": results[name]["relative_gap"]} for name in names}
+    g.graph["iterations"] = max(result["iterations"] for result in results.values())
+    g.graph["relative_gap"] = max(result["relative_gap"] for result in results.values())
+    return g
+
+
+def solve_network_periods(net, periods, vehicle_classes, algorithm="bfw", warm_start=None, progress=None,
+                          workers=None, telemetry=None, **options):
+    # The periods solved on an already compiled network; returns the result
+    # arrays of every period by name.
+    names = list(periods)
+    if not names:
+        raise ValueError("No demand periods to solve")
+
+    periods = {name: ODMatrix.coerce(periods[name]) for name in names}
+    warm_starts = (warm_start or {}).get("periods", {})
+    telemetry = telemetry or Telemetry()
+    workers = min(workers or multiprocessing.cpu_count(), len(names))
+
+    latest = {}
+
+    def report(name, iteration, gap):
+        latest[name] = (iteration, gap)
+        if progress:
+            # The run is as far along as its slowest period.
+            progress(max(i for i, _ in latest.values()), max(gap for _, gap in latest.values()))
+
+    origins = set().union(*(matrix.origins() for matrix in periods.values()))
+    with telemetry.solve(algorithm, net, len(origins)):
+        if workers <= 1:
+            results = {}
+            for name in names:
+                results[name] = NETWORK_SOLVERS[algorithm](
+                    net, periods[name], vehicle_classes, warm_start=warm_starts.get(name),
+                    progress=lambda iteration, gap, name=name: report(name, iteration, gap),
+                    telemetry=Telemetry(callback=lambda event, name=name: telemetry.relay(event, period=name),
+                                        quiet=True), **options)
+        else:
+            results = _solve_concurrently(net, vehicle_classes, algorithm, periods, warm_starts, workers, report,
+                                          telemetry, options)
+    return {name: results[name] for name in names}
+
+
+def _solve_concurrently(net, vehicle_classes, algorithm, periods, warm_starts, workers, report, telemetry, options):
+    # The compiled network is handed to each worker process once, when the
+    # pool starts; only the demand of a period is sent with its task.
+    messages = multiprocessing.Queue()
+    cancelled = multiprocessing.Event()
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(net, vehicle_classes, messages, cancelled)) as pool:
+        futures = {name: pool.submit(_solve_period, algorithm, name, matrix, warm_starts.get(name), options)
+                   for name, matrix in periods.items()}
+        finished = set()
+        try:
+            while len(finished) < len(futures):
+                try:
+                    kind, name, *message = messages.get(timeout=0.1)
+                except queue.Empty:
+                    # A worker that died never reports back; its future
+                    # carries the error instead.
+                    for name, future in futures.items():
+                        if future.done() and future.exception() and name not in finished:
+                            future.result()
+                    continue
+                if kind == "progress":
+                    report(name, *message)
+                elif kind == "event":
+                    telemetry.relay(message[0], period=name)
+                else:
+                    finished.add(name)
+        except BaseException:
+            cancelled.set()
+            for future in futures.values():
+                future.cancel()
+            raise
+
+        return {name: future.result() for name, future in futures.items()}
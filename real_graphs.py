@@ -1,77 +1,323 @@
-import matplotlib.pyplot as plt
-import networkx as nx
+import math
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from compiled_network import CompiledNetwork
+from multiclass import ClassDemand, vehicle_classes_for, write_class_volumes
+from od_matrix import ODMatrix
+from shortest_paths import all_or_nothing
+from telemetry import Telemetry
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+WARM_START_STEPS = 1
 
 
 def bpr(free_time, volume, capacity, alpha=0.15, beta=4):
     return free_time * (1 + alpha * (volume / capacity) ** beta)
 
 
-def calculate_paths_dijkstra(graph, od_pairs):
-    paths = []
-    for origin, destination, demand in od_pairs:
-        if origin in graph and destination in graph:
-            try:
-                path = nx.shortest_path(graph, origin, destination, weight='travel_time')
-                paths.append((path, demand))
-            except nx.NetworkXNoPath:
-                paths.append(([], 0))
-        else:
-            paths.append(([], 0))
-    return paths
+def bpr_derivative(free_time, volume, capacity, alpha=0.15, beta=4):
+    return free_time * alpha * beta * volume ** (beta - 1) / capacity ** beta
 
 
-def msa(graph, od_pairs, max_iter=10000, convergence_threshold=0.001):
-    g = graph.copy()
+def bpr_integral(free_time, volume, capacity, alpha=0.15, beta=4):
+    return free_time * (volume + alpha * volume ** (beta + 1) / ((beta + 1) * capacity ** beta))
 
-    for u, v, data in g.edges(data=True):
-        data["volume"] = 0
 
-    prev_total_cost = 0
+def beckmann_objective(net, volume):
+    return float(bpr_integral(net.free_time, volume, net.capacity).sum())
 
-    for n_iter in range(1, max_iter + 1):
-        for u, v, data in g.edges(data=True):
-            free_time = data["weight"]
-            volume = data["volume"]
-            capacity = data["capacity"]
-            data["travel_time"] = bpr(free_time, volume, capacity)
 
-        path_assignments = calculate_paths_dijkstra(g, od_pairs)
+def relative_gap(volume, auxiliary_flows, travel_time):
+    total_cost = float(volume @ travel_time)
+    shortest_cost = float(auxiliary_flows @ travel_time)
+    if total_cost <= 0:
+        # Nothing is loaded yet while there is demand to load, as on the
+        # first iteration of a cold MSA start: no gap is meaningful then.
+        return math.inf if shortest_cost > 0 else 0.0
+    return (total_cost - shortest_cost) / total_cost
 
-        auxiliary_flows = {(u, v): 0 for u, v in g.edges()}
 
-        for path, demand in path_assignments:
-            for i in range(len(path) - 1):
-                u, v = path[i], path[i + 1]
-                auxiliary_flows[(u, v)] += demand
+def flow_gap(volume, auxiliary_flows):
+    # At a stochastic equilibrium the loaded flows reproduce the current
+    # volumes, so their relative difference takes the place of the gap.
+    total = float(volume.sum())
+    if total <= 0:
+        # As with the relative gap, empty volumes with demand to load are
+        # not an equilibrium.
+        return math.inf if float(auxiliary_flows.sum()) > 0 else 0.0
+    return float(np.abs(auxiliary_flows - volume).sum()) / total
 
-        total_cost = 0
-        max_diff = 0
 
-        for u, v, data in g.edges(data=True):
-            old_volume = data["volume"]
-            aux_volume = auxiliary_flows.get((u, v), 0)
+def warm_start_volumes(net, od_pairs, warm_start):
+    if not warm_start or "volumes" not in warm_start:
+        return None
 
-            new_volume = (1 - 1 / n_iter) * old_volume + (1 / n_iter) * aux_volume
-            data["volume"] = new_volume
+    added_demand = net.demand_increase(od_pairs, warm_start["od_pairs"])
+    if added_demand is None:
+        return None
 
-            diff = abs(new_volume - old_volume)
-            max_diff = max(max_diff, diff)
+    volume = np.zeros(net.n_edges)
+    for key, value in warm_start["volumes"].items():
+        if key in net.edge_index:
+            volume[net.edge_index[key]] = value
+        elif value > 0:
+            return None
 
-            total_cost += new_volume * data["travel_time"]
+    # Links added since the last solve start empty; demand added since then
+    # is loaded on top of the previous equilibrium at its congested costs.
+    travel_time = bpr(net.free_time, volume, net.capacity)
+    return volume + all_or_nothing(net, added_demand, travel_time)
 
-        rel_gap = abs(total_cost - prev_total_cost) / (prev_total_cost + 1e-10)
-        prev_total_cost = total_cost
 
-        print(f"Iteration {n_iter}: Max flow difference = {max_diff:.6f}, Relative gap = {rel_gap:.6f}")
+def warm_start_steps(warm_start, initial_gap):
+    # The MSA gap falls about as 1/n, so a start whose gap is g0 is worth the
+    # share g/g0 of the steps the previous solve took to reach its gap g. An
+    # edit that barely moves the equilibrium keeps short steps; one that
+    # moves it a lot starts over with long ones.
+    iterations, gap = warm_start.get("iterations"), warm_start.get("relative_gap")
+    if not iterations or gap is None or not math.isfinite(initial_gap) or initial_gap <= 0:
+        return WARM_START_STEPS
+    return int(min(max(iterations * gap / initial_gap, WARM_START_STEPS), iterations))
+
+
+def write_result(graph, net, result):
+    net.volume = result["volume"]
+    net.travel_time = result["travel_time"]
+    net.write_back(graph)
+    if result.get("class_names"):
+        write_class_volumes(graph, net, result["class_names"], result["class_volume"])
+    graph.graph["iterations"] = result["iterations"]
+    graph.graph["relative_gap"] = result["relative_gap"]
+    if "origin_flows" in result:
+        graph.graph["origin_flows"] = result["origin_flows"]
+    return graph
+
+
+def msa(graph, od_pairs, max_iter=10000, convergence_threshold=0.001, warm_start=None, progress=None,
+        workers=1, telemetry=None, vehicle_classes=None, theta=None):
+    g = graph.copy()
+    net = CompiledNetwork(g)
+    return write_result(g, net, solve_msa(net, od_pairs, vehicle_classes_for(g, vehicle_classes), max_iter,
+                                          convergence_threshold, warm_start, progress, workers, telemetry, theta))
+
+
+def solve_msa(net, od_pairs, vehicle_classes, max_iter=10000, convergence_threshold=0.001, warm_start=None,
+              progress=None, workers=1, telemetry=None, theta=None):
+    # With a dispersion theta, each iteration loads the logit stochastic
+    # assignment instead of all-or-nothing, and MSA converges to the
+    # stochastic user equilibrium.
+    od_pairs = ODMatrix.coerce(od_pairs)
+    demand = ClassDemand(net, od_pairs, vehicle_classes)
+    telemetry = telemetry or Telemetry()
+
+    # Volumes are kept per vehicle class; link costs follow the PCE-weighted
+    # total.
+    class_volume = np.zeros((len(demand.names), net.n_edges))
+
+    # A warm start counts as steps already taken, so the first steps do not
+    # throw the previous equilibrium away, and it stops once it is as close
+    # to equilibrium as the solution it started from: the step sizes alone
+    # would keep it going as long as a cold solve.
+    step_offset = 0
+    warm_gap = None
+    initial_volume = None if demand.multiclass else warm_start_volumes(net, od_pairs, warm_start)
+    if initial_volume is not None:
+        class_volume[0] = initial_volume
+        warm_gap = warm_start.get("relative_gap")
+    volume = demand.pce @ class_volume
+
+    algorithm = "msa" if theta is None else "sue"
+    with telemetry.solve(algorithm, net, len(demand)), demand.loader(net, workers, theta) as loader:
+        for n_iter in range(1, max_iter + 1):
+            with telemetry.phase("cost_update"):
+                travel_time = bpr(net.free_time, volume, net.capacity)
+            with telemetry.phase("shortest_paths"):
+                class_auxiliary = loader.load(travel_time)
+                auxiliary_flows = demand.pce @ class_auxiliary
+            if theta is None:
+                rel_gap = relative_gap(volume, auxiliary_flows, travel_time)
+            else:
+                rel_gap = flow_gap(volume, auxiliary_flows)
+            if n_iter == 1 and initial_volume is not None:
+                step_offset = warm_start_steps(warm_start, rel_gap)
+
+            with telemetry.phase("averaging"):
+                step = 1 / (n_iter + step_offset)
+                class_volume = (1 - step) * class_volume + step * class_auxiliary
+                new_volume = demand.pce @ class_volume
+                max_diff = float(np.abs(new_volume - volume).max(initial=0))
+                volume = new_volume
+
+            telemetry.iteration(n_iter, rel_gap, max_diff, beckmann_objective(net, volume), step=step)
+            if progress:
+                progress(n_iter, rel_gap)
+
+            if max_diff < convergence_threshold or (warm_gap is not None and rel_gap <= warm_gap):
+                telemetry.converged(n_iter)
+                break
+
+    return {"volume": volume, "travel_time": bpr(net.free_time, volume, net.capacity),
+            "class_names": demand.class_names(), "class_volume": class_volume,
+            "iterations": n_iter, "relative_gap": rel_gap}
+
+
+def line_search(net, volume, direction, tolerance=1e-10):
+    # The derivative of the Beckmann objective along the direction is
+    # monotone, so the exact step is found by bisecting on its sign.
+    def slope(step):
+        return float(bpr(net.free_time, volume + step * direction, net.capacity) @ direction)
+
+    if slope(1.0) <= 0:
+        return 1.0
+
+    low, high = 0.0, 1.0
+    while high - low > tolerance:
+        mid = (low + high) / 2
+        if slope(mid) > 0:
+            high = mid
+        else:
+            low = mid
+    return (low + high) / 2
 
-        if max_diff < convergence_threshold:
-            print(f"Converged after {n_iter} iterations")
-            break
 
-    return g
+def conjugate_weights(net, volume, auxiliary_flows, prev_target, delta=1e-4):
+    hessian = bpr_derivative(net.free_time, volume, net.capacity)
+    prev_direction = prev_target - volume
 
+    numerator = float(prev_direction @ (hessian * (auxiliary_flows - volume)))
+    denominator = float(prev_direction @ (hessian * (auxiliary_flows - prev_target)))
+    weight = numerator / denominator if denominator != 0 else 0.0
+    weight = min(max(weight, 0.0), 1 - delta)
+
+    return 1 - weight, weight
+
+
+def biconjugate_weights(net, volume, auxiliary_flows, prev_target, prev_prev_target, prev_step):
+    hessian = bpr_derivative(net.free_time, volume, net.capacity)
+    aux_direction = auxiliary_flows - volume
+    prev_direction = prev_target - volume
+    bfw_direction = prev_step * prev_target + (1 - prev_step) * prev_prev_target - volume
+
+    denominator = float(bfw_direction @ (hessian * (prev_prev_target - prev_target)))
+    mu = -float(bfw_direction @ (hessian * aux_direction)) / denominator if denominator != 0 else 0.0
+    mu = max(0.0, mu)
+
+    denominator = float(prev_direction @ (hessian * prev_direction))
+    nu = -float(prev_direction @ (hessian * aux_direction)) / denominator if denominator != 0 else 0.0
+    nu = max(0.0, nu + mu * prev_step / (1 - prev_step))
+
+    beta_0 = 1 / (1 + mu + nu)
+    return beta_0, nu * beta_0, mu * beta_0
+
+
+def frank_wolfe(graph, od_pairs, max_iter=1000, gap_threshold=1e-4, variant="fw", warm_start=None,
+                progress=None, workers=1, telemetry=None, vehicle_classes=None):
+    g = graph.copy()
+    net = CompiledNetwork(g)
+    return write_result(g, net, solve_frank_wolfe(net, od_pairs, vehicle_classes_for(g, vehicle_classes), max_iter,
+                                                  gap_threshold, variant, warm_start, progress, workers, telemetry))
+
+
+def solve_frank_wolfe(net, od_pairs, vehicle_classes, max_iter=1000, gap_threshold=1e-4, variant="fw",
+                      warm_start=None, progress=None, workers=1, telemetry=None):
+    if variant not in ("fw", "cfw", "bfw"):
+        raise ValueError(f"Unknown Frank-Wolfe variant '{variant}'")
+
+    od_pairs = ODMatrix.coerce(od_pairs)
+    demand = ClassDemand(net, od_pairs, vehicle_classes)
+    pce = demand.pce
+    telemetry = telemetry or Telemetry()
+
+    # Directions and targets are combined the same way for every vehicle
+    # class, so the conjugate weights are computed on PCE-weighted totals and
+    # applied to the per-class flows.
+    prev_target = prev_prev_target = None
+    prev_step = 1.0
+
+    with telemetry.solve(variant, net, len(demand)), demand.loader(net, workers) as loader:
+        initial_volume = None if demand.multiclass else warm_start_volumes(net, od_pairs, warm_start)
+        if initial_volume is not None:
+            class_volume = initial_volume[np.newaxis]
+        else:
+            with telemetry.phase("shortest_paths"):
+                class_volume = loader.load(net.free_time)
+        volume = pce @ class_volume
+
+        for n_iter in range(1, max_iter + 1):
+            with telemetry.phase("cost_update"):
+                travel_time = bpr(net.free_time, volume, net.capacity)
+            with telemetry.phase("shortest_paths"):
+                class_auxiliary = loader.load(travel_time)
+                auxiliary_flows = pce @ class_auxiliary
+
+            rel_gap = relative_gap(volume, auxiliary_flows, travel_time)
+            converged = rel_gap < gap_threshold
+            step = max_diff = 0.0
+
+            if not converged:
+                with telemetry.phase("direction"):
+                    # A full step discards the previous directions, so
+                    # conjugation restarts from a plain Frank-Wolfe step.
+                    class_target = class_auxiliary
+                    if variant == "bfw" and prev_prev_target is not None and prev_step < 1:
+                        w_aux, w_prev, w_prev_prev = biconjugate_weights(net, volume, auxiliary_flows,
+                                                                         pce @ prev_target, pce @ prev_prev_target,
+                                                                         prev_step)
+                        class_target = w_aux * class_auxiliary + w_prev * prev_target + w_prev_prev * prev_prev_target
+                    elif variant != "fw" and prev_target is not None and prev_step < 1:
+                        w_aux, w_prev = conjugate_weights(net, volume, auxiliary_flows, pce @ prev_target)
+                        class_target = w_prev * prev_target + w_aux * class_auxiliary
+
+                    target = pce @ class_target
+                    if float((target - volume) @ travel_time) >= 0:
+                        class_target, target = class_auxiliary, auxiliary_flows
+
+                with telemetry.phase("line_search"):
+                    step = line_search(net, volume, target - volume)
+                    class_volume = class_volume + step * (class_target - class_volume)
+                    new_volume = pce @ class_volume
+                max_diff = float(np.abs(new_volume - volume).max(initial=0))
+                volume = new_volume
+
+                if step < 1:
+                    prev_prev_target, prev_target = prev_target, class_target
+                else:
+                    prev_prev_target, prev_target = None, None
+                prev_step = step
+
+            telemetry.iteration(n_iter, rel_gap, max_diff, beckmann_objective(net, volume), step=step)
+            if progress:
+                progress(n_iter, rel_gap)
+
+            if converged:
+                telemetry.converged(n_iter)
+                break
+
+    return {"volume": volume, "travel_time": bpr(net.free_time, volume, net.capacity),
+            "class_names": demand.class_names(), "class_volume": class_volume,
+            "iterations": n_iter, "relative_gap": rel_gap}
+
+
+def conjugate_frank_wolfe(graph, od_pairs, max_iter=1000, gap_threshold=1e-4, warm_start=None, progress=None,
+                          workers=1, telemetry=None, vehicle_classes=None):
+    return frank_wolfe(graph, od_pairs, max_iter, gap_threshold, variant="cfw", warm_start=warm_start,
+                       progress=progress, workers=workers, telemetry=telemetry, vehicle_classes=vehicle_classes)
+
+
+def biconjugate_frank_wolfe(graph, od_pairs, max_iter=1000, gap_threshold=1e-4, warm_start=None, progress=None,
+                            workers=1, telemetry=None, vehicle_classes=None):
+    return frank_wolfe(graph, od_pairs, max_iter, gap_threshold, variant="bfw", warm_start=warm_start,
+                       progress=progress, workers=workers, telemetry=telemetry, vehicle_classes=vehicle_classes)
+
+
+def draw_msa_result(graph: "nx.Graph"):
+    import matplotlib.pyplot as plt
+    import networkx as nx
 
-def draw_msa_result(graph: nx.Graph):
     plt.figure(figsize=(10, 8), dpi=100)
     plt.title("MSA Traffic Assignment Results", fontsize=14)
 
@@ -108,6 +354,8 @@ def draw_msa_result(graph: nx.Graph):
 
 
 def create_test_graph():
+    import networkx as nx
+
     G = nx.DiGraph()
 
     G.add_nodes_from(range(4))
@@ -124,4 +372,5 @@ def create_test_graph():
     return G
 
 
-print(msa(create_test_graph(), [[0, 3, 10]]))
+if __name__ == "__main__":
+    print(msa(create_test_graph(), [[0, 3, 10]]))
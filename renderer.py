@@ -0,0 +1,313 @@
+import math
+
+import pygame
+
+from viewport import DETAIL_COARSE, DETAIL_FULL, DETAIL_MEDIUM, Viewport
+
+EDITOR_STYLE = {
+    "background": (255, 255, 255),
+    "node_fill": (52, 152, 219),
+    "node_border": (41, 128, 185),
+    "node_label": (255, 255, 255),
+    "edge": (149, 165, 166),
+    "edge_label": (52, 73, 94),
+    "label_border": (204, 204, 204),
+    "od": (231, 76, 60),
+}
+
+RESULT_STYLE = dict(EDITOR_STYLE, node_fill=(102, 179, 255), node_border=(31, 120, 180), edge=(160, 160, 160),
+                    edge_label=(30, 30, 30), label_border=(128, 128, 128))
+
+NODE_RADIUS = 18
+SMALL_NODE_RADIUS = 5
+ARROW_SIZE = 10
+OD_CURVATURE = 0.3
+CURVE_SEGMENTS = 24
+# Past this share of the canvas, one full redraw is cheaper than many
+# clipped ones.
+FULL_REDRAW_FRACTION = 0.5
+
+
+class GlyphCache:
+    def __init__(self, family="Arial"):
+        self.family = family
+        self._fonts = {}
+        self._glyphs = {}
+
+    def font(self, size, bold=False):
+        key = (size, bold)
+        if key not in self._fonts:
+            self._fonts[key] = pygame.font.SysFont(self.family, size, bold=bold)
+        return self._fonts[key]
+
+    def render(self, text, size, color, bold=False):
+        key = (text, size, tuple(color), bold)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            glyph = self._glyphs[key] = self.font(size, bold).render(text, True, color)
+        return glyph
+
+    def clear(self):
+        self._glyphs.clear()
+
+
+def _trim(start, end, radius):
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = math.hypot(dx, dy)
+    if length <= 2 * radius:
+        return None
+    ux, uy = dx / length, dy / length
+    return (start[0] + ux * radius, start[1] + uy * radius), (end[0] - ux * radius, end[1] - uy * radius)
+
+
+def _arrow(tip, previous, size):
+    dx, dy = tip[0] - previous[0], tip[1] - previous[1]
+    length = math.hypot(dx, dy) or 1.0
+    ux, uy = dx / length, dy / length
+    base = (tip[0] - ux * size, tip[1] - uy * size)
+    return (tip, (base[0] - uy * size * 0.45, base[1] + ux * size * 0.45),
+            (base[0] + uy * size * 0.45, base[1] - ux * size * 0.45))
+
+
+def _curve(start, end, curvature, radius):
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    control = ((start[0] + end[0]) / 2 + curvature * dy, (start[1] + end[1]) / 2 - curvature * dx)
+    points = []
+    for i in range(CURVE_SEGMENTS + 1):
+        t = i / CURVE_SEGMENTS
+        x = (1 - t) ** 2 * start[0] + 2 * (1 - t) * t * control[0] + t ** 2 * end[0]
+        y = (1 - t) ** 2 * start[1] + 2 * (1 - t) * t * control[1] + t ** 2 * end[1]
+        if math.hypot(x - start[0], y - start[1]) > radius and math.hypot(x - end[0], y - end[1]) > radius:
+            points.append((round(x), round(y)))
+    middle = (round((start[0] + end[0]) / 2 + curvature * dy / 2), round((start[1] + end[1]) / 2 - curvature * dx / 2))
+    return points, middle
+
+
+def _bounds(points, padding):
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return pygame.Rect(min(xs) - padding, min(ys) - padding, max(xs) - min(xs) + 2 * padding + 1,
+                       max(ys) - min(ys) + 2 * padding + 1)
+
+
+class NetworkRenderer:
+    def __init__(self, width, height, style=EDITOR_STYLE, glyphs=None):
+        self.size = (width, height)
+        self.style = style
+        self.glyphs = glyphs or GlyphCache()
+        self.surface = pygame.Surface(self.size)
+        self.surface.fill(style["background"])
+        self._elements = {}
+        self.last_dirty = []
+
+    def scene(self, graph, positions, od_pairs=(), edge_label=None, edge_widths=None, viewport=None, visible=None,
+              detail=DETAIL_FULL):
+        elements = {}
+        if not positions:
+            return elements
+        if viewport is None:
+            viewport = Viewport(*self.size, margin=NODE_RADIUS * 3)
+            viewport.fit(positions)
+
+        style = self.style
+        transform = viewport.transform
+        screen = {}
+
+        def locate(node):
+            point = screen.get(node)
+            if point is None:
+                point = screen[node] = transform(positions[node])
+            return point
+
+        nodes, edges = visible if visible is not None else (graph.nodes(), graph.edges())
+        radius = NODE_RADIUS if detail == DETAIL_FULL else SMALL_NODE_RADIUS if detail == DETAIL_MEDIUM else 0
+
+        for u, v in edges:
+            if u not in positions or v not in positions:
+                continue
+            start, end = locate(u), locate(v)
+            if detail == DETAIL_COARSE:
+                width = max(1, round(edge_widths[(u, v)])) if edge_widths else 1
+                elements[("edge", u, v)] = (0, "line", (start, end), width, style["edge"])
+                continue
+
+            # Opposing links are drawn side by side instead of on top of
+            # each other.
+            shift = 4 if graph.has_edge(v, u) else 0
+            if shift:
+                dx, dy = end[0] - start[0], end[1] - start[1]
+                length = math.hypot(dx, dy) or 1.0
+                px, py = -dy / length * shift, dx / length * shift
+                start = (start[0] + px, start[1] + py)
+                end = (end[0] + px, end[1] + py)
+            # Links shorter than their end markers are still drawn, from
+            # centre to centre under the nodes.
+            (x1, y1), (x2, y2) = _trim(start, end, radius) or (start, end)
+            width = max(1, round(edge_widths[(u, v)])) if edge_widths else 2
+            line = ((round(x1), round(y1)), (round(x2), round(y2)))
+            elements[("edge", u, v)] = (0, "arrow", line, width, style["edge"])
+
+            label = edge_label(u, v) if edge_label and detail == DETAIL_FULL else None
+            if label:
+                middle = ((x1 + x2) / 2 + (x2 - x1) * 0.1 * bool(shift), (y1 + y2) / 2 + (y2 - y1) * 0.1 * bool(shift))
+                elements[("edge_label", u, v)] = (3, "label", (round(middle[0]), round(middle[1])), tuple(label), 12,
+                                                  style["edge_label"], style["label_border"])
+
+        demand_totals = {}
+        for origin, destination, demand, *_ in od_pairs:
+            demand_totals[(origin, destination)] = demand_totals.get((origin, destination), 0) + demand
+
+        for (origin, destination), demand in demand_totals.items():
+            if origin not in positions or destination not in positions or origin == destination:
+                continue
+            points, middle = _curve(locate(origin), locate(destination), OD_CURVATURE, radius)
+            if len(points) < 2:
+                continue
+            elements[("od", origin, destination)] = (1, "curve", tuple(points), 2, style["od"])
+            if detail == DETAIL_FULL:
+                elements[("od_label", origin, destination)] = (4, "label", middle, (f"D={demand}",), 11, style["od"],
+                                                               style["od"])
+
+        if radius:
+            for node in nodes:
+                if node in positions:
+                    label = str(node) if detail == DETAIL_FULL else None
+                    elements[("node", node)] = (2, "node", locate(node), label, radius)
+
+        return elements
+
+    def _element_rect(self, element):
+        kind = element[1]
+        if kind == "line":
+            return _bounds(element[2], element[3])
+        if kind in ("arrow", "curve"):
+            return _bounds(element[2], element[3] + ARROW_SIZE)
+        if kind == "node":
+            return _bounds([element[2]], element[4] + 2)
+        center, lines, size = element[2], element[3], element[4]
+        glyphs = [self.glyphs.render(line, size, element[5]) for line in lines]
+        width = max(glyph.get_width() for glyph in glyphs) + 8
+        height = sum(glyph.get_height() for glyph in glyphs) + 4
+        rect = pygame.Rect(0, 0, width, height)
+        rect.center = center
+        return rect
+
+    def _draw_element(self, element, rect):
+        kind = element[1]
+        surface = self.surface
+        if kind == "line":
+            start, end = element[2]
+            pygame.draw.line(surface, element[4], start, end, element[3])
+        elif kind == "arrow":
+            start, end = element[2]
+            pygame.draw.line(surface, element[4], start, end, element[3])
+            pygame.draw.polygon(surface, element[4], _arrow(end, start, ARROW_SIZE))
+        elif kind == "curve":
+            points = element[2]
+            pygame.draw.lines(surface, element[4], False, points, element[3])
+            pygame.draw.polygon(surface, element[4], _arrow(points[-1], points[-2], ARROW_SIZE))
+        elif kind == "node":
+            center, label, radius = element[2], element[3], element[4]
+            pygame.draw.circle(surface, self.style["node_fill"], center, radius)
+            pygame.draw.circle(surface, self.style["node_border"], center, radius, min(2, radius))
+            if label:
+                glyph = self.glyphs.render(label, 14, self.style["node_label"], bold=True)
+                surface.blit(glyph, glyph.get_rect(center=center))
+        else:
+            lines, size, color, border = element[3], element[4], element[5], element[6]
+            pygame.draw.rect(surface, self.style["background"], rect, border_radius=4)
+            pygame.draw.rect(surface, border, rect, 1, border_radius=4)
+            y = rect.y + 2
+            for line in lines:
+                glyph = self.glyphs.render(line, size, color)
+                surface.blit(glyph, (rect.centerx - glyph.get_width() // 2, y))
+                y += glyph.get_height()
+
+    def update(self, elements):
+        previous = self._elements
+        full = previous is None
+        previous = previous or {}
+        current = {}
+        dirty = []
+        for key, element in elements.items():
+            old = previous.get(key)
+            if old is not None and old[0] == element:
+                current[key] = old
+            else:
+                rect = self._element_rect(element)
+                current[key] = (element, rect)
+                dirty.append(rect)
+                if old is not None:
+                    dirty.append(old[1])
+        dirty.extend(old[1] for key, old in previous.items() if key not in elements)
+        self._elements = current
+
+        canvas = self.surface.get_rect()
+        dirty = [rect.clip(canvas) for rect in dirty]
+        dirty = [rect for rect in dirty if rect.w and rect.h]
+        if full or sum(rect.w * rect.h for rect in dirty) > canvas.w * canvas.h * FULL_REDRAW_FRACTION:
+            dirty = [canvas]
+        elif not dirty:
+            self.last_dirty = []
+            return self.last_dirty
+
+        self._redraw(current.values(), dirty)
+        self.last_dirty = dirty
+        return dirty
+
+    def _redraw(self, items, dirty):
+        ordered = sorted(items, key=lambda item: item[0][0])
+        # Each dirty rectangle is cleared and every element overlapping it
+        # is drawn again under a clip, so untouched parts of the canvas keep
+        # their pixels.
+        for rect in dirty:
+            self.surface.set_clip(rect)
+            self.surface.fill(self.style["background"], rect)
+            for element, element_rect in ordered:
+                if element_rect.colliderect(rect):
+                    self._draw_element(element, element_rect)
+        self.surface.set_clip(None)
+
+    def _visible(self, viewport, index, rect=None):
+        if index is None:
+            return None, DETAIL_FULL
+        rect = rect or self.surface.get_rect()
+        bounds = viewport.world_bounds(rect.x, rect.y, rect.w, rect.h, padding=NODE_RADIUS * 3)
+        return index.query(bounds), viewport.detail(index.typical_length)
+
+    def edge_segments(self):
+        # Where each link was last drawn on the canvas, from tail to head.
+        return {(key[1], key[2]): element[2] for key, (element, _) in (self._elements or {}).items()
+                if key[0] == "edge"}
+
+    def draw(self, graph, positions, od_pairs=(), edge_label=None, edge_widths=None, viewport=None, index=None):
+        visible, detail = self._visible(viewport, index)
+        return self.update(self.scene(graph, positions, od_pairs, edge_label, edge_widths, viewport, visible, detail))
+
+    def scroll(self, graph, positions, dx, dy, od_pairs=(), edge_label=None, edge_widths=None, viewport=None,
+               index=None):
+        width, height = self.size
+        if abs(dx) >= width or abs(dy) >= height:
+            self._elements = None
+            return self.draw(graph, positions, od_pairs, edge_label, edge_widths, viewport, index)
+
+        # The pixels already on the canvas are moved and only the strips
+        # uncovered by the move are drawn, from the elements the spatial
+        # index finds under them.
+        self.surface.scroll(dx, dy)
+        exposed = []
+        if dx:
+            exposed.append(pygame.Rect(0 if dx > 0 else width + dx, 0, abs(dx), height))
+        if dy:
+            exposed.append(pygame.Rect(0, 0 if dy > 0 else height + dy, width, abs(dy)))
+
+        for rect in exposed:
+            visible, detail = self._visible(viewport, index, rect)
+            elements = self.scene(graph, positions, od_pairs, edge_label, edge_widths, viewport, visible, detail)
+            self._redraw([(element, self._element_rect(element)) for element in elements.values()], [rect])
+
+        # Element rectangles no longer match the canvas, so the next edit
+        # redraws the whole view once.
+        self._elements = None
+        self.last_dirty = exposed
+        return exposed
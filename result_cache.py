@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from od_matrix import ODMatrix
+
+CACHE_DIRECTORY = "result_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_EXTENSION = ".result"
+# Bumped whenever solver output changes, so older entries are never reused.
+CACHE_VERSION = 1
+
+# Only these attributes reach the solvers; anything else on an edge, such as
+# the volume of an earlier run, does not change the result.
+INPUT_EDGE_FIELDS = ("weight", "capacity", "classes")
+RESULT_EDGE_FIELDS = ("volume", "travel_time", "class_volumes", "period_volumes", "period_travel_times")
+RESULT_GRAPH_FIELDS = ("iterations", "relative_gap", "class_names", "period_names", "period_results",
+                       "origin_flows")
+
+
+def _demand_cells(od_pairs):
+    matrix = ODMatrix.coerce(od_pairs)
+    return sorted([repr(o), repr(d), name, demand] for name in matrix.classes() for o, row in matrix.rows(name)
+                  for d, demand in row.items())
+
+
+def result_key(graph, od_pairs, algorithm, settings=None, periods=None):
+    # Nodes and links are hashed in a canonical order, so the same network
+    # built in a different order maps to the same entry.
+    edges = sorted([repr(u), repr(v)] + [sorted(data[field]) if field == "classes" and data.get(field) else
+                                        data.get(field) for field in INPUT_EDGE_FIELDS]
+                   for u, v, data in graph.edges(data=True))
+    content = {
+        "version": CACHE_VERSION,
+        "nodes": sorted(repr(node) for node in graph.nodes()),
+        "edges": edges,
+        "vehicle_classes": graph.graph.get("vehicle_classes"),
+        "demand": _demand_cells(od_pairs) if periods is None else None,
+        "periods": [[name, _demand_cells(matrix)] for name, matrix in periods.items()] if periods else None,
+        "algorithm": algorithm,
+        "settings": settings or {},
+    }
+    encoded = json.dumps(content, sort_keys=True, default=repr).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=CACHE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def get(self, key, graph):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            # The modification time doubles as the last use for eviction.
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        result = graph.copy()
+        for field, values in entry["edges"].items():
+            for (u, v), value in zip(entry["edge_keys"], values):
+                if not result.has_edge(u, v):
+                    return None
+                result[u][v][field] = value
+        result.graph.update(entry["graph"])
+        return result
+
+    def put(self, key, result):
+        edge_keys = [(u, v) for u, v in result.edges()]
+        entry = {
+            "edge_keys": edge_keys,
+            "edges": {field: [result[u][v][field] for u, v in edge_keys] for field in RESULT_EDGE_FIELDS
+                      if all(field in result[u][v] for u, v in edge_keys)},
+            "graph": {field: result.graph[field] for field in RESULT_GRAPH_FIELDS if field in result.graph},
+        }
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written under a temporary name first, so a reader never sees
+            # half an entry.
+            fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._path(key))
+        except OSError as e:
+            print(f"Error caching result: {e}")
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_EXTENSION):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(CACHE_EXTENSION):
+                    os.remove(os.path.join(self.directory, name))
+
+    def wrap(self, solver, algorithm, periods=False, **settings):
+        # A cached solver takes the same arguments as the one it wraps. Warm
+        # starts, progress and telemetry only change how a result is found,
+        # not the result, so they are not part of the key.
+        def cached_solver(graph, od_pairs, warm_start=None, progress=None, telemetry=None, **options):
+            options = dict(settings, **options)
+            key = result_key(graph, None if periods else od_pairs, algorithm, options, od_pairs if periods else None)
+            result = self.get(key, graph)
+            if result is not None:
+                result.graph["cached"] = True
+                return result
+
+            result = solver(graph, od_pairs, warm_start=warm_start, progress=progress, telemetry=telemetry,
+                            **options)
+            self.put(key, result)
+            return result
+
+        return cached_solver
@@ -0,0 +1,209 @@
+import csv
+import math
+import os
+from itertools import islice
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 65536
+EXPORT_FORMATS = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+
+LINK_COLUMNS = [("scenario", "string"), ("period", "string"), ("from", "string"), ("to", "string"),
+                ("weight", "float"), ("capacity", "float"), ("volume", "float"), ("travel_time", "float"),
+                ("vc_ratio", "float")]
+HISTORY_COLUMNS = [("scenario", "string"), ("period", "string"), ("algorithm", "string"), ("iteration", "int"),
+                   ("relative_gap", "float"), ("max_flow_change", "float"), ("objective", "float"),
+                   ("elapsed", "float")]
+
+
+def export_format(filepath):
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{extension}', expected one of {', '.join(EXPORT_FORMATS)}")
+    return EXPORT_FORMATS[extension]
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet and Arrow export need pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+class TableWriter:
+    # Rows are handed over in chunks of columns and written out straight
+    # away, so a table is never held in memory as a whole. The file is
+    # opened with the first chunk, until then the columns may still change.
+    def __init__(self, filepath, columns):
+        self.filepath = filepath
+        self.format = export_format(filepath)
+        self.columns = columns
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        if self.format != "csv":
+            _arrow()
+
+    def _open(self):
+        if self.format == "csv":
+            self._file = open(self.filepath, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow([name for name, _ in self.columns])
+            return
+
+        pa = _arrow()
+        types = {"string": pa.string(), "float": pa.float64(), "int": pa.int64()}
+        self._schema = pa.schema([(name, types[kind]) for name, kind in self.columns])
+        if self.format == "parquet":
+            self._writer = pa.parquet.ParquetWriter(self.filepath, self._schema)
+        else:
+            self._file = pa.OSFile(self.filepath, "wb")
+            self._writer = pa.ipc.new_file(self._file, self._schema)
+
+    def write_chunk(self, chunk):
+        if self._writer is None:
+            self._open()
+        if self.format == "csv":
+            self._writer.writerows(zip(*(chunk[name] for name, _ in self.columns)))
+        else:
+            # Node names may be numbers or text, so Arrow columns hold them
+            # as text, the same as a CSV file does.
+            pa = _arrow()
+            arrays = [pa.array([None if value is None else str(value) for value in chunk[name]] if kind == "string"
+                               else chunk[name], type=self._schema.field(name).type)
+                      for name, kind in self.columns]
+            self._writer.write_batch(pa.record_batch(arrays, schema=self._schema))
+        self.rows += len(chunk[self.columns[0][0]])
+
+    def close(self):
+        # A table nothing was written to still gets its header.
+        if self._writer is None:
+            self._open()
+        if self.format != "csv":
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LinkResultWriter(TableWriter):
+    # One row per link and period. Several results, e.g. the scenarios of a
+    # batch, can be written to the same file one after another; class
+    # volumes get a column each, for the classes of the first result.
+    def __init__(self, filepath, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__(filepath, LINK_COLUMNS)
+        self.chunk_size = chunk_size
+        self.class_names = None
+
+    def write(self, graph, scenario=None):
+        if self.class_names is None:
+            self.class_names = list(graph.graph.get("class_names", []))
+            self.columns = LINK_COLUMNS + [(f"volume_{name}", "float") for name in self.class_names]
+
+        periods = graph.graph.get("period_names") or [None]
+        for period in periods:
+            # Class volumes are only kept for the first period of a result.
+            classes = self.class_names if period == periods[0] else []
+            edges = iter(graph.edges(data=True))
+            while True:
+                chunk = list(islice(edges, self.chunk_size))
+                if not chunk:
+                    break
+                self.write_chunk(self._link_columns(chunk, scenario, period, classes))
+
+    def _link_columns(self, chunk, scenario, period, classes):
+        if period is None:
+            volume = [data["volume"] for _, _, data in chunk]
+            travel_time = [data["travel_time"] for _, _, data in chunk]
+        else:
+            volume = [data["period_volumes"][period] for _, _, data in chunk]
+            travel_time = [data["period_travel_times"][period] for _, _, data in chunk]
+        capacity = [data["capacity"] for _, _, data in chunk]
+
+        columns = {
+            "scenario": [scenario] * len(chunk),
+            "period": [period] * len(chunk),
+            "from": [u for u, _, _ in chunk],
+            "to": [v for _, v, _ in chunk],
+            "weight": [data["weight"] for _, _, data in chunk],
+            "capacity": capacity,
+            "volume": volume,
+            "travel_time": travel_time,
+            "vc_ratio": [flow / c if c else math.inf for flow, c in zip(volume, capacity)],
+        }
+        for name in self.class_names:
+            columns[f"volume_{name}"] = ([data.get("class_volumes", {}).get(name) for _, _, data in chunk]
+                                         if name in classes else [None] * len(chunk))
+        return columns
+
+    def write_network(self, net, results, scenario=None):
+        # The same rows from a compiled network and its result arrays, for
+        # runs solved without a graph; results maps period names, or None
+        # for a single period, to the arrays a network solver returns.
+        first = next(iter(results))
+        if self.class_names is None:
+            self.class_names = list(results[first].get("class_names") or [])
+            self.columns = LINK_COLUMNS + [(f"volume_{name}", "float") for name in self.class_names]
+
+        for period, result in results.items():
+            class_volume = {}
+            if period == first and result.get("class_names"):
+                class_volume = dict(zip(result["class_names"], result["class_volume"]))
+            for start in range(0, net.n_edges, self.chunk_size):
+                links = slice(start, start + self.chunk_size)
+                keys = net.edge_keys[links]
+                volume = result["volume"][links]
+                capacity = net.capacity[links]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    vc_ratio = np.where(capacity != 0, volume / capacity, math.inf)
+                columns = {
+                    "scenario": [scenario] * len(keys),
+                    "period": [period] * len(keys),
+                    "from": [u for u, _ in keys],
+                    "to": [v for _, v in keys],
+                    "weight": net.free_time[links].tolist(),
+                    "capacity": capacity.tolist(),
+                    "volume": volume.tolist(),
+                    "travel_time": result["travel_time"][links].tolist(),
+                    "vc_ratio": vc_ratio.tolist(),
+                }
+                for name in self.class_names:
+                    columns[f"volume_{name}"] = (class_volume[name][links].tolist() if name in class_volume
+                                                 else [None] * len(keys))
+                self.write_chunk(columns)
+
+
+class HistoryWriter(TableWriter):
+    # One row per solver iteration, from the history a Telemetry keeps.
+    def __init__(self, filepath, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__(filepath, HISTORY_COLUMNS)
+        self.chunk_size = chunk_size
+
+    def write(self, history, scenario=None):
+        history = iter(history)
+        while True:
+            chunk = list(islice(history, self.chunk_size))
+            if not chunk:
+                break
+            columns = {name: [record.get(name) for record in chunk] for name, _ in self.columns}
+            columns["scenario"] = [scenario] * len(chunk)
+            self.write_chunk(columns)
+
+
+def export_links(filepath, graph, scenario=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    with LinkResultWriter(filepath, chunk_size) as writer:
+        writer.write(graph, scenario)
+    return writer.rows
+
+
+def export_history(filepath, history, scenario=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    with HistoryWriter(filepath, chunk_size) as writer:
+        writer.write(history, scenario)
+    return writer.rows
@@ -1,10 +1,11 @@
-import io
-
-import matplotlib.pyplot as plt
-import networkx as nx
 import numpy as np
 import pygame
 
+from playback import MAX_PARTICLES, PARTICLE_SPACING, ParticlePlayback
+from renderer import NODE_RADIUS, RESULT_STYLE, GlyphCache, NetworkRenderer
+from traffic import CAPACITY_PERIOD, TIME_UNIT
+from viewport import SpatialIndex, Viewport
+
 
 class ResultOverlay:
     def __init__(self):
@@ -13,27 +14,41 @@ class ResultOverlay:
         self.close_button = None
         self.bg_color = pygame.Color(245, 246, 250)
         self.font = pygame.font.SysFont('Arial', 16)
-
-    def prepare_result(self, graph, window_width, window_height):
+        self.glyphs = GlyphCache()
+        self.graph = None
+        self.positions = None
+        self.period = None
+        self.period_buttons = []
+        self.segments = {}
+        self.canvas_rect = None
+        self.play_button = None
+        self.playback = None
+        self.playing = False
+        self._last_tick = None
+
+    def prepare_result(self, graph, window_width, window_height, positions=None, period=None):
         self.width = window_width
         self.height = window_height
+        self.graph = graph
+        self.positions = positions
+        period_names = graph.graph.get("period_names", [])
+        self.period = period if period in period_names else next(iter(period_names), None)
         self.surface = pygame.Surface((self.width, self.height))
         self.surface.fill(self.bg_color)
 
-        result_surface = self.create_result_surface(graph)
-
-        img_w, img_h = result_surface.get_size()
-        scale = min(self.width / img_w * 0.9, self.height / img_h * 0.75)
-        new_w, new_h = int(img_w * scale), int(img_h * scale)
-
-        scaled_surface = pygame.transform.smoothscale(result_surface, (new_w, new_h))
+        new_w, new_h = int(self.width * 0.9), int(self.height * 0.75)
+        result_surface = self.create_result_surface(graph, positions, (new_w, new_h), self.period)
 
         pos_x = (self.width - new_w) // 2
         pos_y = (self.height - new_h) // 2 - 50
-        self.surface.blit(scaled_surface, (pos_x, pos_y))
+        self.surface.blit(result_surface, (pos_x, pos_y))
+        self.canvas_rect = pygame.Rect(pos_x, pos_y, new_w, new_h)
+        self.playback = None
+        self.playing = False
+        self.draw_period_buttons(period_names, pos_y - 40)
 
         stats_y = pos_y + new_h + 10
-        self.draw_statistics(graph, stats_y)
+        self.draw_statistics(graph, stats_y, self.period)
 
         button_width, button_height = 150, 35
         button_x = (self.width - button_width) // 2
@@ -46,9 +61,76 @@ class ResultOverlay:
         text_y = button_y + (button_height - txt_surface.get_height()) // 2
         self.surface.blit(txt_surface, (text_x, text_y))
 
+        self.play_button = pygame.Rect(button_x - button_width - 20, button_y, button_width, button_height)
+        self.draw_play_button()
+
         self.visible = True
 
-    def draw_statistics(self, graph, start_y):
+    def can_play(self):
+        return bool(self.segments)
+
+    def draw_play_button(self):
+        # Without any drawn link there is nothing to animate.
+        color = pygame.Color(46, 204, 113) if self.can_play() else pygame.Color(189, 195, 199)
+        pygame.draw.rect(self.surface, color, self.play_button, border_radius=5)
+        txt_surface = self.font.render("Pause Traffic" if self.playing else "Play Traffic", True,
+                                       pygame.Color(255, 255, 255))
+        self.surface.blit(txt_surface, (self.play_button.x + (self.play_button.w - txt_surface.get_width()) // 2,
+                                        self.play_button.y + (self.play_button.h - txt_surface.get_height()) // 2))
+
+    def create_playback(self):
+        # Dynamic loading results animate the vehicles on each link over
+        # time; static results keep each link at its average occupancy.
+        keys = [(u, v) for u, v in self.graph.edges() if (u, v) in self.segments]
+        segments = [self.segments[key][0] + self.segments[key][1] for key in keys]
+        values = [self.edge_values(self.graph[u][v], self.period) for u, v in keys]
+        travel_times = [travel_time for _, travel_time in values]
+        load = [volume / self.graph[u][v]["capacity"] if self.graph[u][v].get("capacity") else 0.0
+                for (u, v), (volume, _) in zip(keys, values)]
+
+        times = self.graph.graph.get("dynamic_times")
+        if times and self.period is None:
+            counts = np.array([self.graph[u][v]["occupancy"] for u, v in keys], dtype=float).T
+        else:
+            times = None
+            counts = [volume * travel_time * TIME_UNIT / CAPACITY_PERIOD for volume, travel_time in values]
+
+        length = sum(np.hypot(x2 - x1, y2 - y1) for x1, y1, x2, y2 in segments)
+        budget = min(MAX_PARTICLES, int(length / PARTICLE_SPACING))
+        return ParticlePlayback(segments, counts, travel_times, load, times, budget)
+
+    def toggle_playback(self):
+        if not self.can_play():
+            return
+        if self.playback is None:
+            self.playback = self.create_playback()
+        self.playing = not self.playing
+        self._last_tick = pygame.time.get_ticks()
+        self.draw_play_button()
+
+    def draw_period_buttons(self, period_names, y):
+        self.period_buttons = []
+        button_width, gap = 120, 10
+        x = (self.width - len(period_names) * (button_width + gap) + gap) // 2
+        for name in period_names:
+            rect = pygame.Rect(x, y, button_width, 30)
+            selected = name == self.period
+            pygame.draw.rect(self.surface, pygame.Color(52, 152, 219) if selected else pygame.Color(225, 225, 230),
+                             rect, border_radius=5)
+            txt_surface = self.font.render(str(name), True,
+                                           pygame.Color(255, 255, 255) if selected else pygame.Color(30, 30, 30))
+            self.surface.blit(txt_surface, (rect.x + (rect.w - txt_surface.get_width()) // 2,
+                                            rect.y + (rect.h - txt_surface.get_height()) // 2))
+            self.period_buttons.append((rect, name))
+            x += button_width + gap
+
+    @staticmethod
+    def edge_values(data, period=None):
+        if period is not None:
+            return data["period_volumes"][period], data["period_travel_times"][period]
+        return data.get("volume", 0), data.get("travel_time", 0)
+
+    def draw_statistics(self, graph, start_y, period=None):
         title_font = pygame.font.SysFont('Arial', 20, bold=True)
         stats_font = pygame.font.SysFont('Arial', 16)
 
@@ -58,8 +140,7 @@ class ResultOverlay:
         total_time = 0
 
         for u, v, data in graph.edges(data=True):
-            volume = data.get("volume", 0)
-            travel_time = data.get("travel_time", 0)
+            volume, travel_time = self.edge_values(data, period)
             edge_cost = volume * travel_time
 
             edge_costs.append((u, v, travel_time, volume, edge_cost))
@@ -104,63 +185,46 @@ class ResultOverlay:
                 y_offset -= 25 * i
                 cur_width = self.width + self.width // 2
 
-    def create_result_surface(self, graph):
-        fig = plt.figure(figsize=(10, 8), dpi=100)
-        plt.title("MSA Traffic Assignment Results", fontsize=14)
+    def create_result_surface(self, graph, positions=None, size=(1000, 800), period=None):
+        if positions is None:
+            import networkx as nx
+            positions = nx.spring_layout(graph, seed=42)
 
-        pos = nx.spring_layout(graph, seed=42)
-
-        nx.draw_networkx_nodes(graph, pos,
-                               node_color="#66b3ff",
-                               edgecolors="#1f78b4",
-                               node_size=700)
-
-        volumes = [data.get("volume", 0) for _, _, data in graph.edges(data=True)]
+        values = {(u, v): self.edge_values(data, period) for u, v, data in graph.edges(data=True)}
+        volumes = [volume for volume, _ in values.values()]
         max_volume = max(volumes) if volumes else 1
         min_volume = min(volumes) if volumes else 0
 
-        if max_volume - min_volume > 100:
-            edge_widths = [1 + 5 * (np.log1p(data.get("volume", 0)) / np.log1p(max_volume))
-                           for _, _, data in graph.edges(data=True)]
-        else:
-            edge_widths = []
-            for _, _, data in graph.edges(data=True):
-                vol = data.get("volume", 0)
-                if max_volume == min_volume:
-                    width = 2
-                else:
-                    width = 1 + 7 * ((vol - min_volume) / (max_volume - min_volume))
-                edge_widths.append(width)
-
-        nx.draw_networkx_edges(graph, pos,
-                               width=edge_widths,
-                               edge_color="#808080",
-                               alpha=0.7)
-
-        nx.draw_networkx_labels(graph, pos, font_size=12, font_color="white", font_weight="bold")
+        edge_widths = {}
+        for (u, v), (vol, _) in values.items():
+            if max_volume - min_volume > 100:
+                width = 1 + 5 * (np.log1p(vol) / np.log1p(max_volume))
+            elif max_volume == min_volume:
+                width = 2
+            else:
+                width = 1 + 7 * ((vol - min_volume) / (max_volume - min_volume))
+            edge_widths[(u, v)] = width
 
         edge_labels = {}
         for u, v, data in graph.edges(data=True):
-            vol = data.get("volume", 0)
-            ttime = data.get("travel_time", 0)
+            vol, ttime = values[(u, v)]
             cap = data.get("capacity", "N/A")
-            edge_labels[(u, v)] = f"v={vol:.1f}\nt={ttime:.1f}\nc={cap}"
+            edge_labels[(u, v)] = (f"v={vol:.1f}", f"t={ttime:.1f}", f"c={cap}")
 
-        nx.draw_networkx_edge_labels(graph, pos, edge_labels=edge_labels,
-                                     font_size=9,
-                                     bbox=dict(facecolor="white", edgecolor="gray", alpha=0.7))
+        # As in the editor, large networks are drawn with less detail rather
+        # than with their links hidden under the nodes.
+        viewport = Viewport(*size, margin=NODE_RADIUS * 3)
+        viewport.fit(positions)
+        renderer = NetworkRenderer(*size, style=RESULT_STYLE, glyphs=self.glyphs)
+        renderer.draw(graph, positions, edge_label=lambda u, v: edge_labels.get((u, v)), edge_widths=edge_widths,
+                      viewport=viewport, index=SpatialIndex(positions, graph.edges()))
+        self.segments = renderer.edge_segments()
 
-        plt.axis("off")
-        plt.tight_layout()
+        title_text = "Traffic Assignment Results" if period is None else f"Traffic Assignment Results: {period}"
+        title = self.glyphs.render(title_text, 18, (30, 30, 30))
+        renderer.surface.blit(title, ((size[0] - title.get_width()) // 2, 8))
 
-        buffer = io.BytesIO()
-        fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-        buffer.seek(0)
-        image = pygame.image.load(buffer)
-        buffer.close()
-        plt.close(fig)
-
-        return image
+        return renderer.surface
 
     def handle_event(self, event):
         if not self.visible:
@@ -169,10 +233,38 @@ class ResultOverlay:
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.close_button and self.close_button.collidepoint(event.pos):
                 self.visible = False
+                self.playing = False
+                return True
+            if self.play_button and self.play_button.collidepoint(event.pos):
+                self.toggle_playback()
                 return True
+            for rect, name in self.period_buttons:
+                if rect.collidepoint(event.pos) and name != self.period:
+                    self.prepare_result(self.graph, self.width, self.height, self.positions, name)
+                    return True
+
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+            self.toggle_playback()
+            return True
 
         return False
 
     def draw(self, screen):
-        if self.visible and self.surface:
-            screen.blit(self.surface, (0, 0))
+        if not (self.visible and self.surface):
+            return
+        screen.blit(self.surface, (0, 0))
+        if not self.playing:
+            return
+
+        # Particles go straight onto the screen, which gets the result
+        # surface again every frame, so nothing has to be erased.
+        tick = pygame.time.get_ticks()
+        self.playback.advance((tick - self._last_tick) / 1000)
+        self._last_tick = tick
+        self.playback.draw(screen, self.canvas_rect.topleft)
+
+        time = self.playback.current_time()
+        if time is not None:
+            minutes = int(time // 60)
+            label = self.font.render(f"t = {minutes // 60:02d}:{minutes % 60:02d}", True, pygame.Color(30, 30, 30))
+            screen.blit(label, (self.canvas_rect.x + 10, self.canvas_rect.y + 8))
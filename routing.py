@@ -0,0 +1,83 @@
+import heapq
+import math
+
+import numpy as np
+
+from shortest_paths import shortest_path_tree
+
+DEFAULT_LANDMARKS = 8
+
+
+class LandmarkIndex:
+    def __init__(self, net, cost, n_landmarks=DEFAULT_LANDMARKS):
+        # ALT: shortest distances from and to a few landmarks give, through
+        # the triangle inequality, a lower bound on the distance between any
+        # two nodes, which steers an A* search towards its target.
+        self.net = net
+        self.cost = np.asarray(cost, dtype=float).tolist()
+        reversed_net, order = net.reverse()
+        reversed_cost = np.asarray(cost, dtype=float)[order].tolist()
+
+        from_landmark, to_landmark = [], []
+        closest = np.full(net.n_nodes, np.inf)
+        landmark = 0
+        for _ in range(min(n_landmarks, net.n_nodes)):
+            from_landmark.append(shortest_path_tree(net, landmark, self.cost)[2])
+            to_landmark.append(shortest_path_tree(reversed_net, landmark, reversed_cost)[2])
+
+            # Each new landmark is the node farthest from those chosen so
+            # far; nodes none of them reach count as farthest of all.
+            reach = np.minimum(from_landmark[-1], to_landmark[-1])
+            closest = np.minimum(closest, np.where(np.isfinite(reach), reach, -1.0))
+            candidates = np.where(closest < 0, np.inf, closest)
+            candidates[closest == 0] = -np.inf
+            landmark = int(np.argmax(candidates))
+            if not candidates[landmark] > 0:
+                break
+
+        self.from_landmark = np.array(from_landmark)
+        self.to_landmark = np.array(to_landmark)
+
+    def lower_bounds(self, target):
+        # d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L) for
+        # every landmark L; an infinite bound means t cannot be reached.
+        with np.errstate(invalid="ignore"):
+            bounds = np.fmax(self.from_landmark[:, target, None] - self.from_landmark,
+                             self.to_landmark - self.to_landmark[:, target, None])
+        bounds = np.fmax.reduce(bounds, axis=0)
+        return np.where(np.isnan(bounds) | (bounds < 0), 0.0, bounds).tolist()
+
+    def shortest_path(self, origin, destination):
+        net = self.net
+        if origin not in net.node_index or destination not in net.node_index:
+            return None
+        source, target = net.node_index[origin], net.node_index[destination]
+        bound = self.lower_bounds(target)
+        if math.isinf(bound[source]):
+            return None
+
+        indptr, head, tail = net.adjacency()
+        cost = self.cost
+        dist = {source: 0.0}
+        pred_edge = {}
+        heap = [(bound[source], 0.0, source)]
+        while heap:
+            _, d, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if d > dist[node]:
+                continue
+            for e in range(indptr[node], indptr[node + 1]):
+                v = head[e]
+                nd = d + cost[e]
+                if nd < dist.get(v, math.inf) and not math.isinf(bound[v]):
+                    dist[v] = nd
+                    pred_edge[v] = e
+                    heapq.heappush(heap, (nd + bound[v], nd, v))
+        else:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(tail[pred_edge[path[-1]]])
+        return [net.nodes[i] for i in reversed(path)]
@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import struct
+from array import array
+
+import networkx as nx
+import numpy as np
+
+from compiled_network import CompiledNetwork
+from od_matrix import DEFAULT_CLASS, ODMatrix
+
+BINARY_EXTENSION = ".scn"
+BINARY_MAGIC = b"TRAFSCN1"
+BINARY_ALIGNMENT = 64
+
+
+def read_scenario(filepath):
+    if filepath.endswith(BINARY_EXTENSION):
+        return read_binary_scenario(filepath)
+    if filepath.endswith(".tntp"):
+        return read_tntp(filepath, tntp_trips_path(filepath))
+
+    with open(filepath, 'r') as f:
+        graph_data = json.load(f)
+
+    graph = nx.DiGraph()
+    graph.add_nodes_from(graph_data['nodes'])
+    for u, v, d in graph_data['edges']:
+        graph.add_edge(u, v, **d)
+
+    if 'positions' in graph_data:
+        graph.graph['positions'] = {node: tuple(p) for node, p in zip(graph_data['nodes'], graph_data['positions'])}
+    if 'vehicle_classes' in graph_data:
+        graph.graph['vehicle_classes'] = graph_data['vehicle_classes']
+    if 'periods' in graph_data:
+        graph.graph['periods'] = {name: ODMatrix(pairs) for name, pairs in graph_data['periods'].items()}
+
+    return graph, ODMatrix(graph_data['od_pairs'])
+
+
+def write_scenario(filepath, graph, od_pairs, positions=None, periods=None):
+    if filepath.endswith(BINARY_EXTENSION):
+        write_binary_scenario(filepath, graph, od_pairs, positions, periods)
+        return
+    if filepath.endswith(".tntp"):
+        raise ValueError("TNTP files can only be imported")
+
+    graph_data = {
+        'nodes': list(graph.nodes()),
+        'edges': [(u, v, d) for u, v, d in graph.edges(data=True)],
+        'od_pairs': [list(pair) for pair in ODMatrix.coerce(od_pairs)]
+    }
+    if positions and all(node in positions for node in graph):
+        graph_data['positions'] = [list(positions[node]) for node in graph.nodes()]
+    if graph.graph.get('vehicle_classes'):
+        graph_data['vehicle_classes'] = graph.graph['vehicle_classes']
+    if periods:
+        graph_data['periods'] = {name: [list(pair) for pair in ODMatrix.coerce(matrix)]
+                                 for name, matrix in periods.items()}
+
+    with open(filepath, 'w') as f:
+        json.dump(graph_data, f, indent=2)
+
+
+def _align(offset):
+    return -(-offset // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+
+
+def write_binary_arrays(filepath, nodes, arrays):
+    specs = {}
+    offset = 0
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        specs[name] = {"dtype": values.dtype.str, "shape": list(values.shape), "offset": offset}
+        offset = _align(offset + values.nbytes)
+
+    header = json.dumps({"nodes": nodes, "arrays": specs}).encode("utf-8")
+    data_start = _align(len(BINARY_MAGIC) + 8 + len(header))
+
+    with open(filepath, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, values in arrays.items():
+            f.seek(data_start + specs[name]["offset"])
+            f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate(data_start + offset)
+
+
+def read_binary_arrays(filepath):
+    with open(filepath, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{filepath} is not a binary scenario file")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length))
+
+    # Arrays are mapped straight from the file; nothing is read until a
+    # caller touches the data.
+    data_start = _align(len(BINARY_MAGIC) + 8 + header_length)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+        else:
+            arrays[name] = np.memmap(filepath, dtype=spec["dtype"], mode="r", offset=data_start + spec["offset"],
+                                     shape=shape)
+
+    return header["nodes"], arrays
+
+
+def scenario_class_names(graph, matrices):
+    names = set(graph.graph.get("vehicle_classes") or {})
+    for matrix in matrices:
+        names.update(matrix.classes())
+    for _, _, data in graph.edges(data=True):
+        names.update(data.get("classes") or ())
+    names.discard(DEFAULT_CLASS)
+    return [DEFAULT_CLASS] + sorted(names)
+
+
+def od_matrix_arrays(node_index, od_pairs, class_index=None, prefix="od"):
+    indptr, destinations, demands, classes = ODMatrix.coerce(od_pairs).to_csr(node_index, class_index)
+    arrays = {f"{prefix}_indptr": indptr, f"{prefix}_destination": destinations, f"{prefix}_demand": demands}
+    if classes.any():
+        arrays[f"{prefix}_class"] = classes
+    return arrays
+
+
+def od_matrix_from_arrays(nodes, arrays, class_names, prefix="od"):
+    return ODMatrix.from_csr(nodes, arrays[f"{prefix}_indptr"], arrays[f"{prefix}_destination"],
+                             arrays[f"{prefix}_demand"], arrays.get(f"{prefix}_class"), class_names)
+
+
+def write_binary_scenario(filepath, graph, od_pairs, positions=None, periods=None):
+    od_pairs = ODMatrix.coerce(od_pairs)
+    periods = {name: ODMatrix.coerce(matrix) for name, matrix in (periods or {}).items()}
+    nodes = list(graph.nodes())
+    node_index = {node: i for i, node in enumerate(nodes)}
+    edges = list(graph.edges(data=True))
+
+    arrays = {
+        "tail": np.array([node_index[u] for u, _, _ in edges], dtype=np.int64),
+        "head": np.array([node_index[v] for _, v, _ in edges], dtype=np.int64),
+        "weight": np.array([d["weight"] for _, _, d in edges], dtype=float),
+        "capacity": np.array([d["capacity"] for _, _, d in edges], dtype=float),
+    }
+    if positions and all(node in positions for node in nodes):
+        arrays["x"] = np.array([positions[node][0] for node in nodes], dtype=float)
+        arrays["y"] = np.array([positions[node][1] for node in nodes], dtype=float)
+
+    # Vehicle classes are only written for multi-class scenarios, so
+    # single-class files keep the plain layout.
+    class_names = scenario_class_names(graph, [od_pairs, *periods.values()])
+    class_index = None
+    if len(class_names) > 1 or graph.graph.get("vehicle_classes"):
+        class_index = {name: c for c, name in enumerate(class_names)}
+        arrays["class_names"] = np.array(class_names)
+        pce = graph.graph.get("vehicle_classes") or {}
+        arrays["class_pce"] = np.array([pce.get(name, np.nan) for name in class_names], dtype=float)
+        if any(d.get("classes") is not None for _, _, d in edges):
+            arrays["edge_classes"] = np.array([[d.get("classes") is None or name in d["classes"]
+                                                for name in class_names] for _, _, d in edges], dtype=bool)
+    arrays.update(od_matrix_arrays(node_index, od_pairs, class_index))
+    if periods:
+        arrays["period_names"] = np.array(list(periods))
+        for i, matrix in enumerate(periods.values()):
+            arrays.update(od_matrix_arrays(node_index, matrix, class_index, prefix=f"period{i}_od"))
+    write_binary_arrays(filepath, nodes, arrays)
+
+
+def _binary_classes(arrays):
+    class_names = arrays["class_names"].tolist() if "class_names" in arrays else [DEFAULT_CLASS]
+    pce = {}
+    if "class_pce" in arrays:
+        pce = {name: value for name, value in zip(class_names, arrays["class_pce"].tolist()) if value == value}
+    edge_classes = None
+    if "edge_classes" in arrays:
+        edge_classes = [None if all(allowed) else [name for name, ok in zip(class_names, allowed) if ok]
+                        for allowed in arrays["edge_classes"].tolist()]
+    return class_names, pce, edge_classes
+
+
+def _binary_demand(nodes, arrays, class_names):
+    periods = None
+    if "period_names" in arrays:
+        periods = {name: od_matrix_from_arrays(nodes, arrays, class_names, prefix=f"period{i}_od")
+                   for i, name in enumerate(arrays["period_names"].tolist())}
+    return od_matrix_from_arrays(nodes, arrays, class_names), periods
+
+
+def read_binary_scenario(filepath):
+    nodes, arrays = read_binary_arrays(filepath)
+    class_names, pce, edge_classes = _binary_classes(arrays)
+
+    graph = nx.DiGraph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from((nodes[u], nodes[v], {"weight": w, "capacity": c})
+                         for u, v, w, c in zip(arrays["tail"].tolist(), arrays["head"].tolist(),
+                                               arrays["weight"].tolist(), arrays["capacity"].tolist()))
+    if "x" in arrays:
+        graph.graph["positions"] = dict(zip(nodes, zip(arrays["x"].tolist(), arrays["y"].tolist())))
+    if pce:
+        graph.graph["vehicle_classes"] = pce
+    if edge_classes:
+        for (u, v), classes in zip(graph.edges(), edge_classes):
+            if classes is not None:
+                graph[u][v]["classes"] = classes
+
+    od_pairs, periods = _binary_demand(nodes, arrays, class_names)
+    if periods:
+        graph.graph["periods"] = periods
+    return graph, od_pairs
+
+
+def read_binary_network(filepath):
+    # The solver route: link arrays are compiled straight from the mapped
+    # file, without building a networkx graph first. Returns the compiled
+    # network, the demand, the PCE factors stored with the scenario and the
+    # demand periods, if any.
+    nodes, arrays = read_binary_arrays(filepath)
+    class_names, pce, edge_classes = _binary_classes(arrays)
+    net = CompiledNetwork.from_arrays(nodes, arrays["tail"], arrays["head"], arrays["weight"], arrays["capacity"],
+                                      edge_classes)
+    od_pairs, periods = _binary_demand(nodes, arrays, class_names)
+    return net, od_pairs, pce, periods
+
+
+def tntp_trips_path(network_path):
+    if network_path.endswith("_net.tntp"):
+        trips_path = network_path[:-len("_net.tntp")] + "_trips.tntp"
+        if os.path.exists(trips_path):
+            return trips_path
+    return None
+
+
+def _tntp_lines(filepath):
+    with open(filepath, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(("~", "<")):
+                yield line
+
+
+def iter_tntp_links(filepath):
+    # Columns: init_node term_node capacity length free_flow_time b power
+    # speed toll link_type. Only capacity and free-flow time are used; the
+    # solvers apply the standard BPR parameters to every link.
+    for line in _tntp_lines(filepath):
+        fields = line.rstrip(";").split()
+        yield int(fields[0]), int(fields[1]), float(fields[4]), float(fields[2])
+
+
+def iter_tntp_trips(filepath):
+    origin = None
+    for line in _tntp_lines(filepath):
+        if line.startswith("Origin"):
+            origin = int(line.split()[1])
+            continue
+        for entry in line.split(";"):
+            if ":" not in entry:
+                continue
+            destination, demand = entry.split(":")
+            demand = float(demand)
+            if demand > 0:
+                yield origin, int(destination), demand
+
+
+def read_tntp(network_path, trips_path=None):
+    graph = nx.DiGraph()
+    for u, v, free_flow_time, capacity in iter_tntp_links(network_path):
+        graph.add_edge(u, v, weight=free_flow_time, capacity=capacity)
+
+    od_pairs = ODMatrix(iter_tntp_trips(trips_path) if trips_path else ())
+    return graph, od_pairs
+
+
+def convert_tntp(network_path, trips_path, output_path):
+    tail, head = array("q"), array("q")
+    weight, capacity = array("d"), array("d")
+    for u, v, free_flow_time, link_capacity in iter_tntp_links(network_path):
+        tail.append(u)
+        head.append(v)
+        weight.append(free_flow_time)
+        capacity.append(link_capacity)
+
+    nodes = sorted(set(tail) | set(head))
+    node_index = {node: i for i, node in enumerate(nodes)}
+    lookup = np.zeros(max(nodes, default=0) + 1, dtype=np.int64)
+    lookup[nodes] = np.arange(len(nodes))
+
+    arrays = {
+        "tail": lookup[np.frombuffer(tail, dtype=np.int64)],
+        "head": lookup[np.frombuffer(head, dtype=np.int64)],
+        "weight": np.frombuffer(weight, dtype=float),
+        "capacity": np.frombuffer(capacity, dtype=float),
+    }
+    arrays.update(od_matrix_arrays(node_index, iter_tntp_trips(trips_path) if trips_path else []))
+    write_binary_arrays(output_path, nodes, arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert TNTP network and trips files to a binary scenario.")
+    parser.add_argument("network", help="TNTP network file (*_net.tntp)")
+    parser.add_argument("trips", nargs="?", help="TNTP trips file (defaults to the matching *_trips.tntp)")
+    parser.add_argument("-o", "--output", help=f"output file (defaults to the network name with {BINARY_EXTENSION})")
+    args = parser.parse_args()
+
+    trips = args.trips or tntp_trips_path(args.network)
+    output = args.output or os.path.splitext(args.network)[0].removesuffix("_net") + BINARY_EXTENSION
+    convert_tntp(args.network, trips, output)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
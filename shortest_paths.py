@@ -0,0 +1,135 @@
+import heapq
+import math
+
+import numpy as np
+
+
+def shortest_path_tree(net, origin, cost, targets=None):
+    indptr, head, _ = net.adjacency()
+    dist = [math.inf] * net.n_nodes
+    pred_edge = [-1] * net.n_nodes
+    settled = [False] * net.n_nodes
+    targets = set(targets) if targets is not None else set()
+    remaining = len(targets)
+
+    dist[origin] = 0.0
+    heap = [(0.0, origin)]
+    order = []
+
+    while heap:
+        d, node = heapq.heappop(heap)
+        if settled[node]:
+            continue
+        settled[node] = True
+        order.append(node)
+
+        if node in targets:
+            remaining -= 1
+            if remaining == 0:
+                break
+
+        for e in range(indptr[node], indptr[node + 1]):
+            nd = d + cost[e]
+            v = head[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                pred_edge[v] = e
+                heapq.heappush(heap, (nd, v))
+
+    return order, pred_edge, dist
+
+
+def all_or_nothing(net, demand, cost, n_classes=None):
+    # With n_classes, each origin's demands are a (classes, destinations)
+    # array; the tree is built once and every class is loaded on it.
+    _, _, tail = net.adjacency()
+    cost = cost.tolist()
+    flows = [[0.0] * net.n_edges for _ in range(n_classes or 1)]
+
+    for origin, destinations, demands in demand:
+        destinations = destinations.tolist()
+        order, pred_edge, _ = shortest_path_tree(net, origin, cost, destinations)
+
+        for class_flows, class_demands in zip(flows, demands.reshape(-1, len(destinations)).tolist()):
+            if not any(class_demands):
+                continue
+
+            node_flow = [0.0] * net.n_nodes
+            for d, q in zip(destinations, class_demands):
+                node_flow[d] += q
+
+            # Walking the settled nodes from farthest to nearest pushes each
+            # node's accumulated demand onto its tree edge exactly once.
+            for node in reversed(order):
+                q = node_flow[node]
+                if q and node != origin:
+                    e = pred_edge[node]
+                    class_flows[e] += q
+                    node_flow[tail[e]] += q
+
+    return np.array(flows) if n_classes else np.array(flows[0])
+
+
+def logit_loading(net, demand, cost, theta, n_classes=None):
+    # Dial's STOCH loading: each origin's demand is split over its efficient
+    # links, those leading away from the origin, with logit probabilities in
+    # theta times the extra cost of a link over the shortest path.
+    _, head, tail = net.adjacency()
+    cost_list = cost.tolist()
+    head_array = np.asarray(head)
+    tail_array = np.asarray(tail)
+    flows = [[0.0] * net.n_edges for _ in range(n_classes or 1)]
+
+    for origin, destinations, demands in demand:
+        destinations = destinations.tolist()
+        order, pred_edge, dist = shortest_path_tree(net, origin, cost_list, destinations)
+
+        # Nodes past the farthest destination are not on any efficient path
+        # to it, so the tree search may stop there.
+        position = np.full(net.n_nodes, -1, dtype=np.int64)
+        position[order] = np.arange(len(order))
+        dist = np.array(dist)
+        tail_position, head_position = position[tail_array], position[head_array]
+        reached = (tail_position >= 0) & (head_position >= 0)
+        with np.errstate(invalid="ignore"):
+            efficient = reached & (dist[tail_array] < dist[head_array])
+        tree_edges = [e for e in pred_edge if e >= 0]
+        efficient[tree_edges] = reached[tree_edges]
+        edges = np.flatnonzero(efficient)
+        with np.errstate(over="ignore", invalid="ignore"):
+            likelihood = np.exp(theta * (dist[head_array[edges]] - dist[tail_array[edges]] - cost[edges]))
+
+        # Forward pass: a node's weight is the summed likelihood of every
+        # efficient path reaching it. Links are taken in the order their
+        # tails were settled, so each tail's weight is final when used.
+        forward = np.argsort(tail_position[edges], kind="stable")
+        edges, likelihood = edges[forward], likelihood[forward].tolist()
+        backward = np.argsort(-head_position[edges], kind="stable").tolist()
+        edges = edges.tolist()
+        node_weight = [0.0] * net.n_nodes
+        node_weight[origin] = 1.0
+        edge_weight = []
+        for e, value in zip(edges, likelihood):
+            weight = value * node_weight[tail[e]]
+            edge_weight.append(weight)
+            node_weight[head[e]] += weight
+
+        # Backward pass: links are taken from the farthest head inward, and
+        # each passes on its share of everything leaving its head.
+        for class_flows, class_demands in zip(flows, demands.reshape(-1, len(destinations)).tolist()):
+            if not any(class_demands):
+                continue
+
+            node_flow = [0.0] * net.n_nodes
+            for d, q in zip(destinations, class_demands):
+                node_flow[d] += q
+
+            for k in backward:
+                e = edges[k]
+                q = node_flow[head[e]]
+                if q:
+                    x = q * edge_weight[k] / node_weight[head[e]]
+                    class_flows[e] += x
+                    node_flow[tail[e]] += x
+
+    return np.array(flows) if n_classes else np.array(flows[0])
@@ -0,0 +1,109 @@
+import contextlib
+import json
+import math
+import time
+
+HISTORY_FIELDS = ("period", "algorithm", "iteration", "relative_gap", "max_flow_change", "objective", "elapsed")
+
+
+class Telemetry:
+    def __init__(self, callback=None, sink=None, quiet=False):
+        self.callback = callback
+        self.sink = sink
+        self.quiet = quiet
+        self.algorithm = None
+        self.iterations = 0
+        self.phases = {}
+        self.totals = {}
+        # Convergence of every iteration, kept for exporting alongside the
+        # link results.
+        self.history = []
+        self._file = None
+        self._start = None
+
+    def _emit(self, event):
+        if self.callback:
+            self.callback(event)
+        if self._file:
+            # A gap is infinite before anything is loaded, which JSON has no
+            # number for.
+            event = {key: None if isinstance(value, float) and not math.isfinite(value) else value
+                     for key, value in event.items()}
+            self._file.write(json.dumps(event, allow_nan=False) + "\n")
+
+    def _record(self, event):
+        self.history.append({field: event.get(field) for field in HISTORY_FIELDS})
+
+    def _say(self, text):
+        if not self.quiet:
+            print(text)
+
+    @contextlib.contextmanager
+    def solve(self, algorithm, net, origins):
+        self.algorithm = algorithm
+        self.iterations = 0
+        self.phases = {}
+        self.totals = {}
+        self.history = []
+        self._start = time.perf_counter()
+        if self.sink:
+            self._file = open(self.sink, "a")
+
+        self._emit({"event": "start", "algorithm": algorithm, "nodes": net.n_nodes, "edges": net.n_edges,
+                    "origins": origins})
+        status = "error"
+        try:
+            yield self
+            status = "finished"
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            self._emit({"event": "finish", "algorithm": algorithm, "status": status, "iterations": self.iterations,
+                        "seconds": time.perf_counter() - self._start, "phase_seconds": self.totals})
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed
+
+    def iteration(self, n_iter, relative_gap, max_flow_change, objective, **metrics):
+        self.iterations = n_iter
+        event = {
+            "event": "iteration",
+            "algorithm": self.algorithm,
+            "iteration": n_iter,
+            "relative_gap": float(relative_gap),
+            "max_flow_change": float(max_flow_change),
+            "objective": float(objective),
+            "elapsed": time.perf_counter() - self._start,
+            "phases": self.phases,
+        }
+        event.update(metrics)
+        self.phases = {}
+        self._record(event)
+        self._emit(event)
+        self._say(f"Iteration {n_iter}: Relative gap = {relative_gap:.8f}, Max flow change = {max_flow_change:.6f}")
+
+    def relay(self, event, **tags):
+        # Events of a solve that ran elsewhere, such as another process, are
+        # passed on tagged with where they came from.
+        event = dict(event, **tags)
+        if event["event"] == "iteration":
+            self._record(event)
+        self._emit(event)
+        if event["event"] == "finish":
+            where = " ".join(f"{key} {value}" for key, value in tags.items())
+            self._say(f"{where}: {event['status']} after {event['iterations']} iterations")
+
+    def converged(self, n_iter):
+        self._emit({"event": "converged", "algorithm": self.algorithm, "iteration": n_iter})
+        self._say(f"Converged after {n_iter} iterations")
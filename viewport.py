@@ -0,0 +1,158 @@
+import math
+
+MIN_ZOOM = 0.2
+MAX_ZOOM = 200.0
+
+DETAIL_FULL = "full"
+DETAIL_MEDIUM = "medium"
+DETAIL_COARSE = "coarse"
+# Typical on-screen link length, in pixels, needed before labels and then
+# arrowheads and node markers are drawn.
+FULL_DETAIL_LENGTH = 80
+MEDIUM_DETAIL_LENGTH = 20
+
+# Links whose bounding box covers more cells than this are kept in a
+# separate list and checked against every query instead.
+MAX_EDGE_CELLS = 256
+
+
+class Viewport:
+    def __init__(self, width, height, margin=54):
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.scale_x = self.scale_y = 1.0
+        self.offset_x = self.offset_y = 0.0
+        self.zoom = 1.0
+        self.auto_fit = True
+
+    def resize(self, width, height):
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self.auto_fit = True
+
+    def fit(self, positions):
+        if not positions:
+            return
+        xs = [p[0] for p in positions.values()]
+        ys = [p[1] for p in positions.values()]
+        min_x, max_x = min(xs), max(xs)
+        min_y, max_y = min(ys), max(ys)
+        self.scale_x = (self.width - 2 * self.margin) / max(max_x - min_x, 1e-9)
+        self.scale_y = (self.height - 2 * self.margin) / max(max_y - min_y, 1e-9)
+        self.offset_x = (self.width - (max_x - min_x) * self.scale_x) / 2 - min_x * self.scale_x
+        self.offset_y = (self.height - (max_y - min_y) * self.scale_y) / 2 + max_y * self.scale_y
+        self.zoom = 1.0
+
+    def state(self):
+        return self.scale_x, self.scale_y, self.offset_x, self.offset_y
+
+    def transform(self, point):
+        return round(point[0] * self.scale_x + self.offset_x), round(self.offset_y - point[1] * self.scale_y)
+
+    def to_world(self, x, y):
+        return (x - self.offset_x) / self.scale_x, (self.offset_y - y) / self.scale_y
+
+    def world_bounds(self, left=0, top=0, width=None, height=None, padding=0):
+        width = self.width if width is None else width
+        height = self.height if height is None else height
+        min_x, max_y = self.to_world(left - padding, top - padding)
+        max_x, min_y = self.to_world(left + width + padding, top + height + padding)
+        return min_x, min_y, max_x, max_y
+
+    def zoom_at(self, factor, x, y):
+        factor = min(max(self.zoom * factor, MIN_ZOOM), MAX_ZOOM) / self.zoom
+        if factor == 1.0:
+            return False
+        # The world point under the cursor stays where it is on screen.
+        world_x, world_y = self.to_world(x, y)
+        self.zoom *= factor
+        self.scale_x *= factor
+        self.scale_y *= factor
+        self.offset_x = x - world_x * self.scale_x
+        self.offset_y = y + world_y * self.scale_y
+        self.auto_fit = False
+        return True
+
+    def pan(self, dx, dy):
+        self.offset_x += dx
+        self.offset_y += dy
+        self.auto_fit = False
+
+    def detail(self, typical_length):
+        screen_length = typical_length * min(self.scale_x, self.scale_y)
+        if screen_length >= FULL_DETAIL_LENGTH:
+            return DETAIL_FULL
+        if screen_length >= MEDIUM_DETAIL_LENGTH:
+            return DETAIL_MEDIUM
+        return DETAIL_COARSE
+
+
+class SpatialIndex:
+    def __init__(self, positions, edges):
+        self.positions = positions
+        self.n_nodes = len(positions)
+        self.n_edges = 0
+        self.node_cells = {}
+        self.edge_cells = {}
+        self.long_edges = []
+        self.typical_length = 1.0
+        if not positions:
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+            self.cell_size = 1.0
+            return
+
+        xs = [p[0] for p in positions.values()]
+        ys = [p[1] for p in positions.values()]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+        span = max(self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1], 1e-9)
+        # Roughly one node per cell.
+        self.cell_size = span / max(math.sqrt(self.n_nodes), 1.0)
+
+        for node, (x, y) in positions.items():
+            self.node_cells.setdefault(self._cell(x, y), []).append(node)
+
+        lengths = []
+        for u, v in edges:
+            if u not in positions or v not in positions:
+                continue
+            self.n_edges += 1
+            (x1, y1), (x2, y2) = positions[u], positions[v]
+            lengths.append(math.hypot(x2 - x1, y2 - y1))
+            i1, j1 = self._cell(min(x1, x2), min(y1, y2))
+            i2, j2 = self._cell(max(x1, x2), max(y1, y2))
+            if (i2 - i1 + 1) * (j2 - j1 + 1) > MAX_EDGE_CELLS:
+                self.long_edges.append((u, v))
+                continue
+            for i in range(i1, i2 + 1):
+                for j in range(j1, j2 + 1):
+                    self.edge_cells.setdefault((i, j), []).append((u, v))
+
+        if lengths:
+            lengths.sort()
+            self.typical_length = lengths[len(lengths) // 2] or 1.0
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def covers(self, bounds):
+        return (bounds[0] <= self.bounds[0] and bounds[1] <= self.bounds[1] and
+                bounds[2] >= self.bounds[2] and bounds[3] >= self.bounds[3])
+
+    def query(self, bounds):
+        if self.covers(bounds):
+            return None
+
+        min_x, min_y, max_x, max_y = bounds
+        i1, j1 = self._cell(max(min_x, self.bounds[0]), max(min_y, self.bounds[1]))
+        i2, j2 = self._cell(min(max_x, self.bounds[2]), min(max_y, self.bounds[3]))
+        nodes = set()
+        edges = set(self.long_edges)
+        for i in range(i1, i2 + 1):
+            for j in range(j1, j2 + 1):
+                cell = (i, j)
+                if cell in self.node_cells:
+                    nodes.update(self.node_cells[cell])
+                if cell in self.edge_cells:
+                    edges.update(self.edge_cells[cell])
+        return nodes, edges